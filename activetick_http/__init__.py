@@ -1,26 +1,248 @@
 from . quote_fields import quote_definitions, quote_dtypes
-from io import StringIO
+from . segments import DAY, YEAR, segment_bounds, segments_between, align_to_segments, merge_ranges, missing_ranges, \
+    remove_range, exchange_now
+from . memory_cache import MemoryCache
+from . local_store import LocalStore
+from . serializers import ArrowSerializer, PickleSerializer, default_serializer
+from . bars import BarBuilder, resample_bars, _bar_start
+from . records import FRAME, RECORDS, COLUMNS, convert, stream_record, to_columns, to_records, to_frame
+from . metrics import Metrics, url_labels, measure_stream, REQUEST_SECONDS, BYTES, ROWS, PARSE_SECONDS, \
+    CACHE_HITS, CACHE_MISSES, CACHE_READ_SECONDS, CACHE_WRITE_SECONDS, ERRORS, COALESCED
+from . parsers import BAR_DATE_FMT, parse_quote_data, parse_bar_data, parse_tick_data, parse_option_chain, \
+    parse_stream_tick, parse_stream_batch, split_ticks
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from time import monotonic, perf_counter
+from math import ceil
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import BoundedSemaphore, Condition, Lock, Thread, local
+import warnings
+import json
 from requests import Session
+from requests.adapters import HTTPAdapter
 
-# TODO look into read_csv use_cols option for speedups
 # TODO Fix doc comment formatting on methods
 
+# Maximum number of quotes/trades the proxy returns for a single tickData request
+TICKDATA_ROW_LIMIT = 100000
+
+# Longest quoteData URL, longer symbol lists are split in several requests
+QUOTEDATA_URL_LENGTH = 2000
+
+# barData historyType codes
+HISTORY_TYPES = {
+    'I': 0,
+    'D': 1,
+    'W': 2
+}
+
+# Bytes read at a time from tickDataChunks and barDataChunks responses
+CHUNK_READ_SIZE = 1 << 20
+
+# Data newer than this may still change on the proxy side and is not cached
+CACHE_SETTLE_TIME = timedelta(minutes=1)
+
+# Seconds an optionChain response is reused before it is requested again
+OPTION_CHAIN_TTL = 300
+
 class ActiveTick:
-    def __init__(self, host='127.0.0.1', port=5000, cache=False):
+    """
+    Client of the ActiveTick HTTP proxy. One instance can be shared by many threads: every thread uses its
+    own requests Session over one shared connection pool, identical barData, tickData and optionChain calls
+    made at the same time are coalesced into a single fetch, and cache segments of a symbol are read and
+    written by one call at a time
+
+    # Example
+    at = ActiveTick(cache=StrictRedis(host='127.0.0.1'))
+    df = at.barData('INTC')
+    """
+    def __init__(self, host='127.0.0.1', port=5000, cache=False, max_connections=8, memory_cache=None,
+                 serializer=None, metrics=None, parse_executor=None, clock=exchange_now):
 
         # Active tick HTTP proxy config
         self.host = host
         self.port = port
-        self.r = Session()
         self.cache = cache
 
-        self._date_fmt = '%Y%m%d%H%M%S'
+        # Optional in-process MemoryCache consulted before the cache backend
+        self.memory_cache = memory_cache
+
+        # Writes frames to the cache backend and reads back frames of its own or a safe format, ArrowSerializer
+        # by default, None without pyarrow and then frames are only kept in memory_cache or a LocalStore
+        self.serializer = serializer if serializer is not None else default_serializer()
+
+        # Optional Metrics (or any object with its record method) timing requests, parsing, the cache and streams
+        self.metrics = metrics
+
+        # Optional concurrent.futures executor the responses are parsed in, a ProcessPoolExecutor spreads CSV
+        # parsing of concurrent requests over several cores
+        self.parse_executor = parse_executor
+
+        # Function returning the current datetime in the timezone of the proxy timestamps, data newer than
+        # CACHE_SETTLE_TIME before it is not cached
+        self.clock = clock
+
+        # Decoded option chains, kept in process for the ttl given to optionChain
+        self._chains = MemoryCache(max_bytes=64 * 2 ** 20)
+
+        # Pooled keep-alive connections shared by concurrent requests, through one Session per thread
+        self.max_connections = max_connections
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session = None
+        self._local = local()
+        self._request_slots = BoundedSemaphore(max_connections)
+
+        # Requests in flight by key, and locks of the cache segments by key prefix
+        self._lock = Lock()
+        self._inflight = {}
+        self._key_locks = {}
+
+        self._date_fmt = BAR_DATE_FMT
+
+    @property
+    def r(self):
+        """
+        requests Session of the calling thread, or the Session assigned to r which is then used by every thread
+        """
+        if self._session is not None:
+            return self._session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = Session()
+            session.mount('http://', self._adapter)
+        return session
+
+    @r.setter
+    def r(self, session):
+        self._session = session
+
+    @property
+    def stream_(self):
+        """
+        Response of the last quoteStream opened by the calling thread, None before one is requested
+        """
+        return getattr(self._local, 'stream', None)
+
+    @stream_.setter
+    def stream_(self, response):
+        self._local.stream = response
+
+    def _coalesced(self, key, labels, function, *args):
+        """
+        Calls function(*args) once for all the threads asking for the same key at the same time, the others
+        wait and get its result or exception. Every caller gets its own shallow copy of the frames of the result
+        :param key:
+        String, cache key of the request including its time range
+        :param labels:
+        (endpoint, symbol) of the request, for metrics
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            if self.metrics is not None:
+                self.metrics.record(COALESCED, labels[0], labels[1])
+            return _own_frames(future.result())
+
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return _own_frames(future.result())
+
+    def _key_lock(self, key_prefix):
+        """
+        :return:
+        Lock of the cache entries under key_prefix
+        """
+        with self._lock:
+            lock = self._key_locks.get(key_prefix)
+            if lock is None:
+                lock = self._key_locks[key_prefix] = Lock()
+            return lock
+
+    def _get(self, url):
+        """
+        GET request made over the pooled session
+        :return:
+        Response body (bytes)
+        """
+        if self.metrics is None:
+            with self._request_slots:
+                res = self.r.get(url)
+            res.raise_for_status()
+            return res.content
+
+        endpoint, symbol = url_labels(url)
+        try:
+            with self._request_slots:
+                start = perf_counter()
+                res = self.r.get(url)
+                seconds = perf_counter() - start
+            res.raise_for_status()
+        except Exception:
+            self.metrics.record(ERRORS, endpoint, symbol)
+            raise
+        self.metrics.record(REQUEST_SECONDS, endpoint, symbol, seconds)
+        self.metrics.record(BYTES, endpoint, symbol, len(res.content))
+        return res.content
 
-        # Contains generator for stream once requested
-        self.stream_ = None
+    def _get_chunks(self, url):
+        """
+        GET request whose body is read as it arrives, the connection is released once the generator
+        is exhausted or closed. With metrics the request time is the time until the response headers
+        :return:
+        generator of bytes
+        """
+        endpoint, symbol = url_labels(url) if self.metrics is not None else (None, None)
+        received = 0
+        try:
+            with self._request_slots:
+                start = perf_counter()
+                with self.r.get(url, stream=True) as res:
+                    res.raise_for_status()
+                    if self.metrics is not None:
+                        self.metrics.record(REQUEST_SECONDS, endpoint, symbol, perf_counter() - start)
+                    for chunk in res.iter_content(chunk_size=CHUNK_READ_SIZE):
+                        received += len(chunk)
+                        yield chunk
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.record(ERRORS, endpoint, symbol)
+            raise
+        finally:
+            if self.metrics is not None and received:
+                self.metrics.record(BYTES, endpoint, symbol, received)
+
+    def _parse(self, url, parser, body, *args):
+        """
+        Parses the body of a request to url with parser(body, *args), in parse_executor when set, timed when
+        metrics are recorded
+        :return:
+        the parsed DataFrame
+        """
+        if self.parse_executor is not None:
+            parser = partial(_run_parser, self.parse_executor, parser)
+        if self.metrics is None:
+            return parser(body, *args)
+
+        endpoint, symbol = url_labels(url)
+        start = perf_counter()
+        try:
+            df = parser(body, *args)
+        except Exception:
+            self.metrics.record(ERRORS, endpoint, symbol)
+            raise
+        self.metrics.record(PARSE_SECONDS, endpoint, symbol, perf_counter() - start)
+        self.metrics.record(ROWS, endpoint, symbol, _rows(df))
+        return df
 
     def _date_wrap(self, date):
 
@@ -40,19 +262,7 @@ class ActiveTick:
             symbols = '+'.join(symbols)
         return symbols
 
-    def _date_parser(self, date_format):
-        """
-        Date parser function factory for pandas csv parsing of ActiveTick data
-        :param date_format:
-        Format used for parsing date (string)
-        :return:
-        (list of datetimes)
-        """
-        def date_parser(dates):
-            return [ datetime.strptime(date, date_format) for date in dates ]
-        return date_parser
-
-    def quoteData(self, symbols, quoteFields):
+    def quoteData(self, symbols, quoteFields, meta=True, max_url_length=QUOTEDATA_URL_LENGTH):
         """
         symbols - Symbol (or iterable of multiple symbols) for contracts, ie SPY, AAPL--130308C00440000 (string, iter)
         quote_fields - List of all fields of interest (string, list)
@@ -64,48 +274,83 @@ class ActiveTick:
 
         # returns pandas DataFrame with columns named
 
+        Long symbol lists are split in chunks whose URLs fit in max_url_length, requested concurrently
+        over the pooled connections.
+
+        :param meta:
+        Boolean, include the status meta data columns, with meta=False only the requested fields are read
+        :param max_url_length:
+        integer, longest URL sent to the proxy
         :return:
-        pandas.DataFrame() indexed on the symbol column with columns with requested quoteFields
-        with extra status meta data regarding the request and symbols, to just get a DataFrame
-        with the requested fields quoteData('SPY', fields)[fields]
+        pandas.DataFrame() indexed on the symbol column with columns with requested quoteFields typed
+        after quote_fields.quote_dtypes, with extra status meta data regarding the request and symbols,
+        to just get a DataFrame with the requested fields quoteData('SPY', fields, meta=False)
         """
+        names, dtypes, usecols = self._quoteDataColumns(quoteFields, meta)
+        urls = self._quoteDataUrls(symbols, quoteFields, max_url_length)
+
+        # GET requests are made and the CSV is read into a Pandas DataFrame
+        if len(urls) == 1:
+            return self._parse(urls[0], parse_quote_data, self._get(urls[0]), names, dtypes, usecols)
+
+        def __request(url):
+            return self._parse(url, parse_quote_data, self._get(url), names, dtypes, usecols)
+
+        with ThreadPoolExecutor(max_workers=min(len(urls), self.max_connections)) as pool:
+            return pd.concat(list(pool.map(__request, urls)))
+
+    def _quoteDataColumns(self, quoteFields, meta):
+        """
+        :return:
+        (column names of the response, dtypes, columns to read)
+        """
+        if isinstance(quoteFields, str):
+            quoteFields = [quoteFields]
 
         names = ['symbol', 'symbol_status']
-        def __name_fmt(names, field):
+        dtypes = {'symbol': object, 'symbol_status': np.uint8}
+        for field in quoteFields:
             names += ["{f}_field_id".format(f=field),
                       "{f}_status".format(f=field),
                       "{f}_datatype".format(f=field),
                       "{f}".format(f=field)]
-            return names
+            dtypes.update({"{f}_field_id".format(f=field): np.uint8,
+                           "{f}_status".format(f=field): np.uint8,
+                           "{f}_datatype".format(f=field): np.uint8,
+                           "{f}".format(f=field): quote_dtypes[field]})
 
-        if not isinstance(quoteFields, str):
+        usecols = names if meta else ['symbol'] + list(quoteFields)
+        return names, {name: dtypes[name] for name in usecols}, usecols
 
-            # Create column names from quoteFields
-            for field in quoteFields:
-                names = __name_fmt(names, field)
+    def _quoteDataUrls(self, symbols, quoteFields, max_url_length=QUOTEDATA_URL_LENGTH):
+        """
+        :return:
+        list of URLs, each one for a chunk of symbols no longer than max_url_length
+        """
+        if isinstance(quoteFields, str):
+            quoteFields = [quoteFields]
 
-            # TODO: Declare specific dtypes for each column in names
-            # Translate from human readable quoteFields to IDs
-            quoteFields = map(lambda field: quote_definitions[field], quoteFields)
-            quoteFields = '+'.join(quoteFields)
-        else:
+        # Translate from human readable quoteFields to IDs
+        quoteFields = '+'.join(quote_definitions[field] for field in quoteFields)
 
-            # Only one quoteField as string
-            names = __name_fmt(names, quoteFields)
-            quoteFields = quote_definitions[quoteFields]
+        url = "http://{host}:{port}/quoteData?symbol={symbols}&field={quoteFields}"
+        base_length = len(url.format(host=self.host, port=self.port, symbols='', quoteFields=quoteFields))
 
-        url = "http://{host}:{port}/quoteData?symbol={symbols}&field={quoteFields}".format(
-            host=self.host,
-            port=self.port,
-            symbols=self._format_symbols(symbols),
-            quoteFields=quoteFields
-        )
+        if isinstance(symbols, str):
+            symbols = symbols.split('+')
+        chunks = [[]]
+        length = base_length
+        for symbol in symbols:
+            if chunks[-1] and length + len(symbol) + 1 > max_url_length:
+                chunks.append([])
+                length = base_length
+            chunks[-1].append(symbol)
+            length += len(symbol) + 1
 
-        # GET request is made and the CSV is read into a Pandas DataFrame
-        df = pd.read_csv(url, header=None, names=names, index_col='symbol')
-        return df
+        return [url.format(host=self.host, port=self.port, symbols=self._format_symbols(chunk),
+                           quoteFields=quoteFields) for chunk in chunks]
 
-    def quoteStream(self, symbols, timeout=None):
+    def quoteStream(self, symbols, timeout=None, output=FRAME, decimals=None):
         """
         symbols - string or iter of symbols
 
@@ -117,61 +362,80 @@ class ActiveTick:
 
         :param timeout:
         integer, how many seconds to keep connection open
+        :param output:
+        'frame' for one row DataFrames, 'records' for numpy records with the same fields, much cheaper per tick
+        :param decimals:
+        integer, with output='records' prices are int64 counts of 10 ** -decimals, see records.stream_record
 
         :return:
         returns lazy iterator see requests iter_lines() that can be looped over to access streaming data
         """
         # TODO: Start, pause, stop quote stream
 
-        def __tickParse(tick):
-            tick = tick.decode('utf-8')
-            if tick[0] is 'Q':
-                names = ['type', 'symbol', 'cond', 'bid_ex', 'ask_ex', 'bid', 'ask', 'bidz', 'askz', 'datetime']
-                dtype = {'type': object,
-                         'symbol': object,
-                         'cond': np.uint8,
-                         'bid_ex': object,
-                         'ask_ex': object,
-                         'bid': np.float32,
-                         'ask': np.float32,
-                         'bidz': np.uint32,
-                         'askz': np.uint32,
-                         'datetime': object}
-            else:
-                names = ['type', 'symbol', 'flags', 'cond1', 'cond2', 'cond3', 'cond4', 'last_ex', 'last', 'lastz',
-                         'datetime']
-                dtype = {
-                    'type': object,
-                    'symbol': object,
-                    'flags': object,
-                    'cond1': np.int8,
-                    'cond2': np.int8,
-                    'cond3': np.int8,
-                    'cond4': np.int8,
-                    'last_ex': object,
-                    'last': np.float32,
-                    'lastz': np.uint32
-                }
-            date_format = '%Y%m%d%H%M%S%f'
-            parse_date = self._date_parser(date_format)
-
-            return pd.read_csv(StringIO(tick), names=names, index_col='type', dtype=dtype,
-                               parse_dates=['datetime'], date_parser=parse_date)
-
-        url = 'http://{host}:{port}/quoteStream?symbol={symbols}'.format(
+        if output == RECORDS:
+            return map(partial(stream_record, decimals=decimals), self._open_stream(symbols, timeout))
+        if output != FRAME:
+            raise ValueError('quoteStream output must be {frame} or {records}'.format(frame=FRAME, records=RECORDS))
+
+        pandas_stream = map(parse_stream_tick, self._open_stream(symbols, timeout))
+        return pandas_stream
+
+    def quoteStreamBatches(self, symbols, batch_size=5000, batch_interval=0.25, timeout=None):
+        """
+        symbols - string or iter of symbols
+
+        Micro-batched quoteStream, ticks are collected until batch_size lines have arrived or
+        batch_interval seconds have passed since the first tick of the batch, then the whole batch is
+        parsed in one vectorized pass per tick type. Use this instead of quoteStream when the per tick
+        parsing cannot keep up with the proxy. Lines are read on a thread, so batch_interval holds on a quiet
+        stream too.
+
+        # Example
+        for quotes, trades in at.quoteStreamBatches(('SPY', 'VXX')):
+            print(quotes.tail(1), trades.tail(1))
+
+        :param batch_size:
+        integer, maximum number of ticks in a batch, larger batches parse more ticks per second
+        :param batch_interval:
+        float, maximum seconds a tick waits in a batch
+        :param timeout:
+        integer, how many seconds to keep connection open
+
+        :return:
+        lazy iterator of (quotes, trades) tuples of pandas.DataFrame with the columns and dtypes of quoteStream
+        """
+        lines = self._open_stream(symbols, timeout)
+        return map(parse_stream_batch, _batch_lines(lines, batch_size, batch_interval))
+
+    def _open_stream(self, symbols, timeout):
+        """
+        Opens the quoteStream connection, stored in self.stream_ so it can be closed
+        :return:
+        iterator over the raw non-empty lines of the stream, the first (acknowledgement) line is skipped
+        """
+        self.stream_ = self.r.get(self._quoteStreamUrl(symbols), stream=True, timeout=timeout)
+
+        lines = filter(None, self.stream_.iter_lines())
+        first_line = next(lines)
+        return self._measure_stream(lines)
+
+    def _measure_stream(self, lines):
+        """
+        :return:
+        quoteStream lines counted and sampled for lag when metrics are recorded, otherwise lines unchanged
+        """
+        return lines if self.metrics is None else measure_stream(lines, self.metrics)
+
+    def _quoteStreamUrl(self, symbols):
+        return 'http://{host}:{port}/quoteStream?symbol={symbols}'.format(
             host=self.host,
             port=self.port,
             symbols=self._format_symbols(symbols)
         )
 
-        self.stream_ = self.r.get(url, stream=True, timeout=timeout)
-
-        pandas_stream = map(__tickParse, self.stream_.iter_lines())
-        first_line = next(pandas_stream)
-        return pandas_stream
-
     def barData(self, symbol, historyType='I', intradayMinutes=60,
-                beginTime=datetime(datetime.now().year, datetime.now().month, 1), endTime=datetime.now()):
+                beginTime=datetime(datetime.now().year, datetime.now().month, 1), endTime=datetime.now(),
+                derive=False, output=FRAME, decimals=None):
         """
         :param symbol:
          Takes only one symbol, string
@@ -183,69 +447,105 @@ class ActiveTick:
          Beginning date for query (datetime)
         :param endTime:
          Ending date for query (datetime)
+        :param derive:
+         Boolean, build intraday bars over 1 minute and daily bars from 1 minute bars, so every size shares one
+         download and one cache copy. Daily bars are then made of intraday trades only and may differ from the
+         official open and close. Weekly bars are always requested
+        :param output:
+         'frame', 'records' for a numpy structured array or 'columns' for a dict of numpy arrays, with the
+         datetime index as first field, see records.to_records and records.to_columns
+        :param decimals:
+         integer, with records or columns prices are int64 counts of 10 ** -decimals, None for float32
         :return:
          Pandas DataFrame OHLCV indexed on the datetime
         """
-        history_lookup = {
-            'I': 0,
-            'D': 1,
-            'W': 2
-        }
+        if output != FRAME:
+            return convert(self.barData(symbol, historyType, intradayMinutes, beginTime, endTime, derive),
+                           output, decimals)
+
+        history_lookup = HISTORY_TYPES
+
+        if derive and (historyType == 'D' or (historyType == 'I' and intradayMinutes > 1)):
+            minutes = 1440 if historyType == 'D' else intradayMinutes
+            begin = _bar_start(datetime.strptime(self._date_wrap(beginTime), self._date_fmt), minutes)
+            return resample_bars(self.barData(symbol, 'I', 1, begin, endTime), minutes)
 
         def __getIntradayMinutesAttr():
-            # Returns URL segment for intraday minutes if needed
-            if historyType is not 'I':
-                attr_str = ''
-            else:
-                attr_str = 'intradayMinutes={intradayMinutes}&'.format(intradayMinutes=str(intradayMinutes))
-            return attr_str
+            return _intraday_minutes_attr(historyType, intradayMinutes)
 
         beginTime_s = self._date_wrap(beginTime)
         endTime_s = self._date_wrap(endTime)
 
-        cache_key = "AT:BARDATA:{symbol}:{historyType}:{intradayMinutes}:{beginTime}:{endTime}"
-        cache_key = cache_key.format(
+        def __fetch(begin, end):
+            return self._barDataRequest(symbol, history_lookup[historyType], __getIntradayMinutesAttr(),
+                                        begin.strftime(self._date_fmt),
+                                        (end - timedelta(seconds=1)).strftime(self._date_fmt)), end
+
+        # intradayMinutes is not sent for daily and weekly bars, they share one key whatever its value
+        key_prefix = "AT:BARDATA:{symbol}:{historyType}:{intradayMinutes}".format(
             symbol=symbol,
             historyType=history_lookup[historyType],
-            intradayMinutes=intradayMinutes,
-            beginTime=beginTime_s,
-            endTime=endTime_s)
+            intradayMinutes=intradayMinutes if historyType == 'I' else 0)
+
+        def __bars():
+            # Return data from the cache, fetching only the days (years for daily and weekly bars) not cached yet
+            if self.cache or self.memory_cache is not None:
+                begin = datetime.strptime(beginTime_s, self._date_fmt)
+                end = datetime.strptime(endTime_s, self._date_fmt)
+                df = self._segmentCached(key_prefix, DAY if historyType == 'I' else YEAR,
+                                         begin, end + timedelta(seconds=1), __fetch, align=True)
+                return df[(df.index >= begin) & (df.index <= end)] if not df.empty else df
+
+            return self._barDataRequest(symbol, history_lookup[historyType], __getIntradayMinutesAttr(),
+                                        beginTime_s, endTime_s)
 
-        # If the data is cached
-        if self.cache and self.cache.exists(cache_key):
-            return pd.read_msgpack(self.cache.get(cache_key))
+        return self._coalesced('{prefix}:{begin}:{end}'.format(prefix=key_prefix, begin=beginTime_s, end=endTime_s),
+                               ('barData', symbol), __bars)
 
+    def barDataChunks(self, symbol, historyType='I', intradayMinutes=60,
+                      beginTime=datetime(datetime.now().year, datetime.now().month, 1), endTime=datetime.now(),
+                      chunk_size=100000):
+        """
+        Iterates over barData in DataFrames of at most chunk_size bars, each parsed as soon as its bytes arrive.
+        The cache is not used
+        :param chunk_size:
+         integer, bars per DataFrame
+        :return:
+         generator of Pandas DataFrames OHLCV indexed on the datetime, in time order
+        """
+        url = self._barDataUrl(symbol, HISTORY_TYPES[historyType], _intraday_minutes_attr(historyType, intradayMinutes),
+                               self._date_wrap(beginTime), self._date_wrap(endTime))
+        for lines in _line_blocks(self._get_chunks(url), chunk_size):
+            yield self._parse(url, parse_bar_data, b'\n'.join(lines))
+
+    def _barDataRequest(self, symbol, historyType, intradayMinutesAttr, beginTime_s, endTime_s):
+        """
+        Single barData request
+        :return:
+        Pandas DataFrame OHLCV indexed on the datetime
+        """
+        url = self._barDataUrl(symbol, historyType, intradayMinutesAttr, beginTime_s, endTime_s)
+        return self._parse(url, parse_bar_data, self._get(url))
+
+    def _barDataUrl(self, symbol, historyType, intradayMinutesAttr, beginTime_s, endTime_s):
         url = 'http://{host}:{port}/barData?symbol={symbol}&historyType={historyType}' \
               '&{intradayMintuesAttr}beginTime={beginTime}&endTime={endTime}'
-        url = url.format(
+        return url.format(
             host=self.host,
             port=self.port,
             symbol=symbol,
-            historyType=history_lookup[historyType],
-            intradayMintuesAttr=__getIntradayMinutesAttr(),
+            historyType=historyType,
+            intradayMintuesAttr=intradayMinutesAttr,
             beginTime=beginTime_s,
             endTime=endTime_s)
 
-        dtypes = {'datetime': object,
-                  'open': np.float32,
-                  'high': np.float32,
-                  'low': np.float32,
-                  'close': np.float32,
-                  'volume': np.uint32}
-
-        df = pd.read_csv(url, header=None, names=['datetime', 'open', 'high', 'low', 'close', 'volume'],
-                         index_col='datetime', parse_dates=['datetime'], dtype=dtypes)
-
-        # Cache the data
-        if self.cache:
-            self.cache.set(cache_key, df.to_msgpack(compress='zlib'))
-        return df
-
     def tickData(self, symbol, trades=False, quotes=True,
                  beginTime=datetime.now() - timedelta(minutes=15),
-                 endTime=datetime.now()):
+                 endTime=datetime.now(), paginate=True, split=False, output=FRAME, decimals=None):
         """
-        Gets tick level data in between a time range, limited to returning 100,000 quotes/trades at a time
+        Gets tick level data in between a time range. The proxy returns at most 100,000 quotes/trades per request,
+        when paginate is set truncated responses are detected and the rest of the range is split into smaller
+        windows fetched concurrently over the pooled connections
         :param symbol:
         String, ticker for symbol in ActiveTick format
         :param trades:
@@ -257,78 +557,406 @@ class ActiveTick:
         datetime beginning of date range
         :param endTime:
         datetime end of date range
+        :param paginate:
+        Boolean, whether to fetch past the 100,000 row limit of a single request
+        :param split:
+        Boolean, when requesting trades and quotes return them as two typed frames instead of one
+        time ordered frame where the columns of the other tick type are NaN
+        :param output:
+        'frame', 'records' or 'columns', see barData
+        :param decimals:
+        integer, with records or columns prices are int64 counts of 10 ** -decimals, see barData
+        :return:
+        pandas.DataFrame indexed on datetime, or a (trades, quotes) tuple of them when split
+        """
+        if output != FRAME:
+            return convert(self.tickData(symbol, trades, quotes, beginTime, endTime, paginate, split), output, decimals)
+
+        if not trades and not quotes:
+            return pd.DataFrame()
+
+        return self._tickData(symbol, trades, quotes, beginTime, endTime, paginate, split and trades and quotes)
+
+    def tickDataChunks(self, symbol, trades=False, quotes=True,
+                       beginTime=datetime.now() - timedelta(minutes=15), endTime=datetime.now(), chunk_size=100000):
+        """
+        Iterates over tickData in DataFrames of about chunk_size ticks, parsed while the response is downloaded,
+        so memory use does not depend on the length of the range. Truncated responses are continued from their
+        last second, whose ticks are held back until the response is known to be complete. The cache is not used
+        :param chunk_size:
+        integer, lines parsed per DataFrame
         :return:
+        generator of pandas.DataFrame indexed on datetime, in time order
+        """
+        if not trades and not quotes:
+            return
+
+        lo = datetime.strptime(self._date_wrap(beginTime), self._date_fmt)
+        end = datetime.strptime(self._date_wrap(endTime), self._date_fmt)
+        while lo <= end:
+            url = self._tickDataUrl(symbol, trades, quotes, lo.strftime(self._date_fmt), end.strftime(self._date_fmt))
+            rows = 0
+            held = None
+            for lines in _line_blocks(self._get_chunks(url), chunk_size):
+                rows += len(lines)
+                df = self._parse(url, parse_tick_data, b'\n'.join(lines), trades, quotes)
+                if held is not None:
+                    df = pd.concat([held, df])
+                if df.empty:
+                    continue
+
+                # Ticks of the last second so far may be cut off by truncation, they go with the next chunk
+                last_second = df.index.searchsorted(df.index[-1].floor('s'))
+                held = df.iloc[last_second:]
+                if last_second:
+                    yield df.iloc[:last_second]
+
+            if rows < TICKDATA_ROW_LIMIT or held is None:
+                if held is not None:
+                    yield held
+                return
+
+            # Truncated, the held back second is fetched again with the rest of the range
+            cut = held.index[0].floor('s').to_pydatetime()
+            if cut <= lo:
+                warnings.warn('{symbol} has more than {limit} ticks at {second}, '
+                              'the remainder of that second is dropped'.format(
+                                  symbol=symbol, limit=TICKDATA_ROW_LIMIT, second=lo))
+                yield held
+                cut = lo + timedelta(seconds=1)
+            lo = cut
+
+    def _tickData(self, symbol, trades, quotes, beginTime, endTime, paginate, split=False):
+        """
+        tickData of a range, proxy request or parsing errors give an empty result while cache errors are raised
+        :param split:
+        Boolean, return a (trades, quotes) tuple, parsed split from the responses unless read from the cache
         """
+        beginTime_s = self._date_wrap(beginTime)
+        endTime_s = self._date_wrap(endTime)
 
-        tick_date_fmt = '%Y%m%d%H%M%S%f'
-        date_parser = self._date_parser(tick_date_fmt)
-        q_names = ['type',
-                   'datetime',
-                   'bid',
-                   'ask',
-                   'bidz',
-                   'askz',
-                   'bidx',
-                   'askx',
-                   'cond']
-        t_names = ['type',
-                   'datetime',
-                   'last',
-                   'lastz',
-                   'lastx',
-                   'cond1',
-                   'cond2',
-                   'cond3',
-                   'cond4']
-
-        def __get_trades(df):
-            trades_df = df[df[0] == 'T'].copy()
-            trades_df.columns = t_names
-            trades_df.loc[:, 'last'] = trades_df.loc[:, 'last'].astype(np.float32)
-            trades_df.loc[:, 'lastz'] = trades_df.loc[:, 'lastz'].astype(np.uint32)
-            trades_df.loc[:, ['cond1', 'cond2', 'cond3', 'cond4']] = trades_df.loc[:, ['cond1',
-                                                                                       'cond2',
-                                                                                       'cond3',
-                                                                                       'cond4']].astype(np.uint8)
-            return trades_df
-
-        def __get_quotes(df):
-            quotes_df = df[df[0] == 'Q'].copy()
-            quotes_df.columns = q_names
-            quotes_df.loc[:, ['bid', 'ask']] = quotes_df.loc[:, ['bid', 'ask']].astype(np.float32)
-            quotes_df.loc[:, ['bidz', 'askz']] = quotes_df.loc[:, ['bidz', 'askz']].astype(np.uint32)
-            quotes_df.loc[:, 'cond'] = quotes_df.loc[:, 'cond'].astype(np.uint8)
-            return quotes_df
-
-        def __at_request(url, names):
-            if(names):
-                date_col = 'datetime'
-            else:
-                date_col = 1
-                del q_names[1]
-                del t_names[1]
+        def __request(begin_s, end_s, split):
+            # None when the proxy request or its parsing failed
             try:
-                df = pd.read_csv(url, header=None,
-                                 engine='c',
-                                 index_col=date_col,
-                                 parse_dates=[date_col],
-                                 names=names,
-                                 date_parser=date_parser)
-                return df
+                if paginate:
+                    return self._tickDataPaged(symbol, trades, quotes, begin_s, end_s, split)
+                if split:
+                    return self._tickDataRequest(symbol, trades, quotes, begin_s, end_s, split=True)
+                return self._tickDataRequest(symbol, trades, quotes, begin_s, end_s)
 
             except Exception as e:
                 print('caught exception:', e)
-                print('No or malformed data: ', url)
-                return pd.DataFrame()
+                print('No or malformed data: ', symbol, begin_s, end_s)
+                return None
 
-        if not trades and not quotes:
+        def __fetch(begin, end):
+            df = __request(begin.strftime(self._date_fmt), end.strftime(self._date_fmt), False)
+
+            # Nothing of a failed request is cached
+            if df is None:
+                return pd.DataFrame(), begin
+
+            # A truncated single request is complete only up to the second of its last tick, the rest of the
+            # range is left uncached for a later paginated call
+            complete = end
+            if not paginate and len(df) >= TICKDATA_ROW_LIMIT:
+                complete = max(df.index[-1].to_pydatetime().replace(microsecond=0), begin)
+
+            # endTime is inclusive for the proxy, ticks of the end second belong to the next range
+            return (df[df.index < end] if not df.empty else df), complete
+
+        begin = datetime.strptime(beginTime_s, self._date_fmt)
+        end = datetime.strptime(endTime_s, self._date_fmt) + timedelta(seconds=1)
+
+        key_prefix = 'AT:TICKDATA:{symbol}:{trades}:{quotes}'.format(
+            symbol=symbol,
+            trades=int(trades),
+            quotes=int(quotes)
+        )
+
+        def __ticks():
+            # Return data from the cache, fetching only the ranges not cached yet
+            if self.cache or self.memory_cache is not None:
+                df = self._segmentCached(key_prefix, DAY, begin, end, __fetch, align=False)
+                return split_ticks(df) if split else df
+
+            df = __request(beginTime_s, endTime_s, split)
+            if df is None:
+                return split_ticks(pd.DataFrame()) if split else pd.DataFrame()
+            return df
+
+        return self._coalesced('{prefix}:{begin}:{end}:{paginate}:{split}'.format(
+            prefix=key_prefix, begin=beginTime_s, end=endTime_s, paginate=int(paginate), split=int(split)),
+            ('tickData', symbol), __ticks)
+
+    def _segmentCached(self, key_prefix, segment, begin, end, fetch, align):
+        """
+        Answers the range [begin, end) from cache segments, one per day or year, going to the proxy
+        only for the parts never fetched before. The ranges already fetched are kept as JSON under
+        key_prefix:COVERAGE and every segment frame under key_prefix:segment_id. Segments and coverage are read
+        and written under the lock of key_prefix, the proxy is requested outside it so calls for other ranges
+        of the same symbol fetch concurrently
+        :param key_prefix:
+        String, cache key without the time range
+        :param segment:
+        DAY or YEAR
+        :param fetch:
+        function (begin, end) returning the DataFrame indexed on datetime for the range [begin, end) and the
+        datetime up to which that DataFrame is complete, only that part is cached
+        :param align:
+        Boolean, fetch whole segments (bars) instead of exactly the missing ranges (ticks)
+        :return:
+        pandas.DataFrame for [begin, end) in time order
+        """
+        labels = _cache_labels(key_prefix)
+        if align:
+            begin, end = align_to_segments(begin, end, segment)
+
+        # Only ranges old enough not to change on the proxy are cached, for bars only whole segments
+        settled = self.clock() - CACHE_SETTLE_TIME
+        settled = segment_bounds(settled, segment)[1] if align else settled.replace(microsecond=0)
+
+        lock = self._key_lock(key_prefix)
+        with lock:
+            pieces, gaps = self._readSegments(labels, key_prefix, segment, begin, end)
+
+        # (begin, end, DataFrame) of the fetched ranges to store
+        fetched = []
+        for gap_begin, gap_end in gaps:
+            if self.metrics is not None:
+                self.metrics.record(CACHE_MISSES, labels[0], labels[1])
+            df, complete = fetch(gap_begin, gap_end)
+            pieces.append((gap_begin, df))
+            store_end = min(complete, settled)
+            if store_end > gap_begin:
+                fetched.append((gap_begin, store_end, df))
+
+        if fetched:
+            with lock:
+                self._writeSegments(labels, key_prefix, segment, fetched)
+
+        pieces = [df for piece_begin, df in sorted(pieces, key=lambda piece: piece[0]) if not df.empty]
+        if not pieces:
             return pd.DataFrame()
+        return pd.concat(pieces)
 
-        beginTime_s = self._date_wrap(beginTime)
-        endTime_s = self._date_wrap(endTime)
+    def _readSegments(self, labels, key_prefix, segment, begin, end):
+        """
+        Reads the cached parts of [begin, end), the caller holds the lock of key_prefix. Segments are stored even
+        when empty, so a covered segment that cannot be read was evicted (LRU, TTL or Redis maxmemory) and is
+        fetched again
+        :return:
+        (list of (begin, DataFrame) cached pieces, list of (begin, end) ranges to fetch)
+        """
+        covered = self._timed(labels, CACHE_READ_SECONDS, self._cache_get, key_prefix + ':COVERAGE',
+                              self._read_blob(self._decode_coverage)) or []
+        pieces = []
+        for covered_begin, covered_end in missing_ranges(missing_ranges(covered, begin, end), begin, end):
+            for segment_id, segment_begin, segment_end in segments_between(covered_begin, covered_end, segment):
+                part_begin, part_end = max(segment_begin, covered_begin), min(segment_end, covered_end)
+                cached = self._timed(labels, CACHE_READ_SECONDS, self._cache_get_frame,
+                                     key_prefix + ':' + segment_id, part_begin, part_end)
+                if cached is None:
+                    covered = remove_range(covered, segment_begin, segment_end)
+                    continue
+                pieces.append((part_begin, cached))
+                if self.metrics is not None:
+                    self.metrics.record(CACHE_HITS, labels[0], labels[1])
+        return pieces, missing_ranges(covered, begin, end)
+
+    def _writeSegments(self, labels, key_prefix, segment, fetched):
+        """
+        Adds fetched ranges to their segments and to the coverage, the caller holds the lock of key_prefix.
+        Coverage is read again, parts stored by other calls while these were fetched are not added twice
+        :param fetched:
+        list of (begin, end, DataFrame) with the rows of [begin, end) in the DataFrame
+        """
+        coverage_key = key_prefix + ':COVERAGE'
+        covered = list(self._timed(labels, CACHE_READ_SECONDS, self._cache_get, coverage_key,
+                                   self._read_blob(self._decode_coverage)) or [])
+        segment_frames = {}
+        for fetched_begin, fetched_end, df in fetched:
+            for segment_id, segment_begin, segment_end in segments_between(fetched_begin, fetched_end, segment):
+                if segment_id not in segment_frames:
+                    segment_frames[segment_id] = self._timed(labels, CACHE_READ_SECONDS, self._cache_get_frame,
+                                                             key_prefix + ':' + segment_id)
+                cached = segment_frames[segment_id]
+                if cached is None:
+                    # Nothing else of the segment is stored, whatever its coverage says
+                    covered = remove_range(covered, segment_begin, segment_end)
+                parts = missing_ranges(covered, max(segment_begin, fetched_begin), min(segment_end, fetched_end))
+                if not parts:
+                    continue
+                rows = pd.concat([_slice_range(df, *part) for part in parts]) if len(parts) > 1 else \
+                    _slice_range(df, *parts[0])
+                if cached is not None:
+                    if rows.empty:
+                        continue
+                    if not cached.empty:
+                        rows = pd.concat([cached, rows]).sort_index(kind='mergesort')
+                segment_frames[segment_id] = rows
+                self._timed(labels, CACHE_WRITE_SECONDS, self._cache_set_frame, key_prefix + ':' + segment_id, rows)
+            covered.append((fetched_begin, fetched_end))
+
+        covered = merge_ranges(covered)
+        self._timed(labels, CACHE_WRITE_SECONDS, self._cache_set, coverage_key, covered, self._encode_coverage)
+
+    def _timed(self, labels, metric, function, *args):
+        """
+        Calls function(*args), recording its duration under metric when metrics are recorded
+        :param labels:
+        (endpoint, symbol) the time is recorded for
+        """
+        if self.metrics is None:
+            return function(*args)
+        start = perf_counter()
+        result = function(*args)
+        self.metrics.record(metric, labels[0], labels[1], perf_counter() - start)
+        return result
+
+    def _cache_get_frame(self, key, begin=None, end=None):
+        """
+        Reads a DataFrame from the cache. Backends storing frames themselves (get_frame and set_frame,
+        like LocalStore) are used directly, other backends store blobs written by self.serializer
+        :param begin:
+        datetime, with end only the rows within [begin, end) are returned
+        :return:
+        pandas.DataFrame or None if key is not cached
+        """
+        if hasattr(self.cache, 'get_frame'):
+            # Ranged reads only load the rows asked for, without a memory cache to keep the whole segment in
+            if begin is not None and self.memory_cache is None:
+                return self.cache.get_frame(key, begin, end)
+            df = self._cache_get(key, self.cache.get_frame)
+        else:
+            df = self._cache_get(key, self._read_blob(self._load_frame))
+        if df is None or begin is None:
+            return df
+        return _slice_range(df, begin, end)
+
+    def _cache_set_frame(self, key, df):
+        """
+        Writes a DataFrame to the cache
+        """
+        if hasattr(self.cache, 'set_frame'):
+            if self.memory_cache is not None:
+                self.memory_cache.set(key, df)
+            self.cache.set_frame(key, df)
+        else:
+            self._cache_set(key, df, self._dump_frame)
+
+    def _cache_get(self, key, read):
+        """
+        Reads a value from the memory cache, then from the cache backend, keeping backend hits in memory
+        :param read:
+        function (key) reading the value from the cache backend, None if key is not cached
+        :return:
+        the value or None if key is not cached
+        """
+        if self.memory_cache is not None:
+            value = self.memory_cache.get(key)
+            if value is not None:
+                return value
+        if not self.cache:
+            return None
+        value = read(key)
+        if value is not None and self.memory_cache is not None:
+            self.memory_cache.set(key, value)
+        return value
+
+    def _cache_set(self, key, value, encode):
+        """
+        Writes a value to the memory cache and the cache backend
+        :param encode:
+        function turning the value into the backend blob
+        """
+        if self.memory_cache is not None:
+            self.memory_cache.set(key, value)
+        if self.cache:
+            self.cache.set(key, encode(value))
+
+    def _read_blob(self, decode):
+        """
+        :param decode:
+        function turning a cache backend blob into its value
+        :return:
+        function (key) reading and decoding a blob, None if key is not cached
+        """
+        def __read(key):
+            blob = self.cache.get(key)
+            return decode(blob) if blob is not None else None
+        return __read
+
+    def _dump_frame(self, df):
+        return self._frame_serializer().dumps(df)
+
+    def _load_frame(self, blob):
+        # Entries of formats the serializer does not accept are treated as missing, fetched again and overwritten
+        try:
+            return self._frame_serializer().loads(blob)
+        except ValueError as e:
+            warnings.warn('Cache entry ignored: {error}'.format(error=e))
+            return None
+
+    def _frame_serializer(self):
+        if self.serializer is None:
+            raise ImportError('Caching frames in {cache} requires pyarrow, install with pip install '
+                              'activetick_http[arrow], or pass serializer=PickleSerializer() if only trusted clients '
+                              'write to the cache'.format(cache=type(self.cache).__name__))
+        return self.serializer
+
+    def _decode_coverage(self, blob):
+        return [tuple(datetime.strptime(t, self._date_fmt) for t in r) for r in json.loads(blob)]
+
+    def _encode_coverage(self, covered):
+        return json.dumps([[t.strftime(self._date_fmt) for t in r] for r in covered])
+
+    def _tickDataPaged(self, symbol, trades, quotes, beginTime_s, endTime_s, split=False):
+        """
+        Fetches a tickData range of any size. Every window answered with TICKDATA_ROW_LIMIT rows was truncated,
+        its complete seconds are kept and the remainder is split into as many windows as the observed tick
+        density requires. Windows overlap on their boundary second and every result is trimmed to its own
+        half open range, so boundary ticks are returned once whether or not the proxy includes endTime.
+        :param split:
+        Boolean, parse mixed responses into (trades, quotes) tuples, see parse_tick_data
+        :return:
+        pandas.DataFrame of the whole range in time order, or a (trades, quotes) tuple of them when split
+        """
+        end = datetime.strptime(endTime_s, self._date_fmt)
+        request = partial(self._tickDataRequest, split=True) if split else self._tickDataRequest
+
+        # (beginTime, endTime) of windows still to fetch, results are keyed by window
+        windows = [(datetime.strptime(beginTime_s, self._date_fmt), end)]
+        frames = {}
 
-        cache_key = 'AT:TICKDATA:{symbol}:{trades}:{quotes}:{beginTime}:{endTime}'
-        cache_key = cache_key.format(
+        with ThreadPoolExecutor(max_workers=self.max_connections) as pool:
+            while windows:
+                futures = [(lo, hi, pool.submit(request, symbol, trades, quotes,
+                                                lo.strftime(self._date_fmt), hi.strftime(self._date_fmt)))
+                           for lo, hi in windows]
+                windows = []
+                for lo, hi, future in futures:
+                    frames[lo, hi], more = _page_window(future.result(), lo, hi, end, symbol)
+                    windows += more
+
+        return _concat_windows(frames)
+
+    def _tickDataRequest(self, symbol, trades, quotes, beginTime_s, endTime_s, split=False):
+        """
+        Single tickData request, the proxy truncates the response at TICKDATA_ROW_LIMIT rows
+        :return:
+        pandas.DataFrame indexed on the tick datetime, or a (trades, quotes) tuple of them when split
+        """
+        url = self._tickDataUrl(symbol, trades, quotes, beginTime_s, endTime_s)
+        return self._parse(url, parse_tick_data, self._get(url), trades, quotes, split)
+
+    def _tickDataUrl(self, symbol, trades, quotes, beginTime_s, endTime_s):
+        url = 'http://{host}:{port}/tickData?symbol={symbol}&trades={trades}' \
+              '&quotes={quotes}&beginTime={beginTime}&endTime={endTime}'
+
+        return url.format(
+            host=self.host,
+            port=self.port,
             symbol=symbol,
             trades=int(trades),
             quotes=int(quotes),
@@ -336,56 +964,345 @@ class ActiveTick:
             endTime=endTime_s
         )
 
-        # Return cached data
-        if self.cache and self.cache.exists(cache_key):
-                return pd.read_msgpack(self.cache.get(cache_key))
+    def barDataMany(self, symbols, historyType='I', intradayMinutes=60,
+                    beginTime=datetime(datetime.now().year, datetime.now().month, 1), endTime=datetime.now(),
+                    max_workers=None, as_frame=False, derive=False):
+        """
+        barData for many symbols at once, requested concurrently over the pooled connections
+        :param symbols:
+         iterable of symbols
+        :param max_workers:
+         Number of symbols requested at the same time, defaults to max_connections
+        :param as_frame:
+         Boolean, return a single DataFrame indexed on (symbol, datetime) instead of a dict
+        :return:
+         (data, errors) data is a dict of symbol to barData DataFrame (or one DataFrame when as_frame),
+         errors a dict of symbol to the exception raised for symbols that failed
+        """
+        def __fetch(symbol):
+            return self.barData(symbol, historyType, intradayMinutes, beginTime, endTime, derive)
+        return self._many(__fetch, symbols, max_workers, as_frame)
 
-        # Retrieve data not found in cache
-        else:
-            url = 'http://{host}:{port}/tickData?symbol={symbol}&trades={trades}' \
-                  '&quotes={quotes}&beginTime={beginTime}&endTime={endTime}'
-
-            url = url.format(
-                host=self.host,
-                port=self.port,
-                symbol=symbol,
-                trades=int(trades),
-                quotes=int(quotes),
-                beginTime=beginTime_s,
-                endTime=endTime_s
-            )
-
-            # Quote column names
-            if quotes and not trades:
-                df = __at_request(url, q_names)
-
-            # Trade columns names
-            if trades and not quotes:
-                df = __at_request(url, t_names)
-
-            if trades and quotes:
-                df = __at_request(url, None)
-                if not df.empty:
-                    df = __get_trades(df).append(__get_quotes(df)).sort_index(axis=0)
+    def tickDataMany(self, symbols, trades=False, quotes=True,
+                     beginTime=datetime.now() - timedelta(minutes=15),
+                     endTime=datetime.now(), max_workers=None, as_frame=False):
+        """
+        tickData for many symbols at once, requested concurrently over the pooled connections
+        :param symbols:
+         iterable of symbols
+        :param max_workers:
+         Number of symbols requested at the same time, defaults to max_connections
+        :param as_frame:
+         Boolean, return a single DataFrame indexed on (symbol, datetime) instead of a dict
+        :return:
+         (data, errors) data is a dict of symbol to tickData DataFrame (or one DataFrame when as_frame),
+         errors a dict of symbol to the exception raised for symbols that failed
+        """
+        def __fetch(symbol):
+            if not trades and not quotes:
+                return pd.DataFrame()
+            return self._tickData(symbol, trades, quotes, beginTime, endTime, paginate=True)
+        return self._many(__fetch, symbols, max_workers, as_frame)
 
-        if self.cache:
-            self.cache.set(cache_key, df.to_msgpack(compress='zlib'))
-        return df
+    def _many(self, fetch, symbols, max_workers, as_frame):
+        """
+        Runs fetch for every symbol in a thread pool, the number of open connections stays bounded
+        by max_connections whatever max_workers is
+        :return:
+        (data, errors) see barDataMany
+        """
+        data = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_connections) as pool:
+            futures = [(symbol, pool.submit(fetch, symbol)) for symbol in symbols]
+            for symbol, future in futures:
+                try:
+                    data[symbol] = future.result()
+                except Exception as e:
+                    errors[symbol] = e
+
+        if as_frame:
+            data = pd.concat(data, names=['symbol']) if data else pd.DataFrame()
+        return data, errors
 
-    def optionChain(self, symbol):
+    def optionChain(self, symbol, ttl=OPTION_CHAIN_TTL):
         """
-        Returns unnamed pandas dataframe of option symbols currently listed for underlying symbol
+        Returns the options currently listed for underlying symbol, with their symbols decoded
         :param symbol:
         String, ticker symbol for underlying
+        :param ttl:
+        seconds the chain is kept in memory and reused, 0 to always request it
         :return:
-        Raw unnamed dataframe from ActiveTick
+        pandas.DataFrame indexed on the option symbol with columns underlying, expiry, right ('C' or 'P')
+        and strike, see parsers.parse_option_chain
         """
-        url = 'http://{host}:{port}/optionChain?symbol={symbol}'.format(
+        if ttl:
+            df = self._chains.get(symbol)
+            if self.metrics is not None:
+                self.metrics.record(CACHE_MISSES if df is None else CACHE_HITS, 'optionChain', symbol)
+            if df is not None:
+                return df.copy(deep=False)
+
+        df = self._coalesced('AT:OPTIONCHAIN:{symbol}'.format(symbol=symbol), ('optionChain', symbol),
+                             self._optionChainRequest, symbol)
+        # The stored chain is never handed out, callers adding columns to theirs don't change it
+        if ttl:
+            self._chains.set(symbol, df, ttl)
+        return df.copy(deep=False)
+
+    def optionChainSnapshot(self, symbol, quoteFields, expiry=None, strikes=None, right=None, meta=False,
+                            ttl=OPTION_CHAIN_TTL, max_url_length=QUOTEDATA_URL_LENGTH):
+        """
+        Quotes for the whole option chain of an underlying, or the part of it selected by expiry, strike
+        and right, fetched with chunked concurrent quoteData requests
+        # Example
+        at.optionChainSnapshot('SPY', ['BidPrice', 'AskPrice'], expiry=(datetime(2016, 10, 1), datetime(2016, 10, 31)),
+                               strikes=(180, 200), right='P')
+        :param quoteFields:
+        List of fields, see quoteData
+        :param expiry:
+        datetime of one expiry or a (first, last) tuple of datetimes, inclusive, None for all
+        :param strikes:
+        (low, high) tuple of strikes, inclusive, None for all
+        :param right:
+        'C' or 'P', None for both
+        :param meta:
+        Boolean, include the quoteData status meta data columns
+        :param ttl:
+        seconds the chain is reused, see optionChain
+        :return:
+        pandas.DataFrame indexed on the option symbol with the optionChain columns followed by quoteFields
+        """
+        chain = self.optionChain(symbol, ttl)
+        selected = np.ones(len(chain), dtype=bool)
+        if expiry is not None:
+            first, last = expiry if isinstance(expiry, tuple) else (expiry, expiry)
+            selected &= (chain['expiry'] >= pd.Timestamp(first)).values & \
+                (chain['expiry'] <= pd.Timestamp(last)).values
+        if strikes is not None:
+            selected &= (chain['strike'] >= strikes[0]).values & (chain['strike'] <= strikes[1]).values
+        if right is not None:
+            selected &= (chain['right'] == right).values
+        chain = chain[selected]
+        if chain.empty:
+            return chain
+
+        quotes = self.quoteData(chain.index.tolist(), quoteFields, meta, max_url_length)
+        return chain.join(quotes)
+
+    def _optionChainRequest(self, symbol):
+        """
+        Single optionChain request
+        :return:
+        pandas.DataFrame indexed on the option symbol, see parsers.parse_option_chain
+        """
+        url = self._optionChainUrl(symbol)
+        return self._parse(url, parse_option_chain, self._get(url))
+
+    def _optionChainUrl(self, symbol):
+        return 'http://{host}:{port}/optionChain?symbol={symbol}'.format(
             host=self.host,
             port=self.port,
             symbol=symbol)
-        df = pd.read_csv(url)
+
+def _intraday_minutes_attr(historyType, intradayMinutes):
+    # Returns URL segment for intraday minutes if needed
+    if historyType != 'I':
+        attr_str = ''
+    else:
+        attr_str = 'intradayMinutes={intradayMinutes}&'.format(intradayMinutes=str(intradayMinutes))
+    return attr_str
+
+
+def _run_parser(executor, parser, *args):
+    # Runs a parser in an executor, waiting for its result
+    return executor.submit(parser, *args).result()
+
+
+def _cache_labels(key_prefix):
+    """
+    (endpoint, symbol) of a cache key prefix such as AT:TICKDATA:SPY:1:1, for metrics
+    """
+    kind, rest = key_prefix.split(':', 2)[1:]
+    endpoint = {'TICKDATA': 'tickData', 'BARDATA': 'barData'}.get(kind, kind)
+    return endpoint, rest.rsplit(':', 2)[0]
+
+
+def _page_window(df, lo, hi, end, symbol):
+    """
+    Checks one tickData window of a paginated request for truncation
+    :param df:
+    pandas.DataFrame, or (trades, quotes) tuple of them, returned for the window [lo, hi]
+    :param end:
+    datetime end of the whole request, the last window keeps the ticks of its end second
+    :return:
+    (rows kept for the window, list of (beginTime, endTime) windows still to fetch)
+    """
+    if _rows(df) < TICKDATA_ROW_LIMIT:
+        return (df if hi == end else _ticks_before(df, hi)), []
+
+    # Truncated, the last second returned may be incomplete so it is fetched again
+    last = max(frame.index[-1] for frame in df if not frame.empty) if isinstance(df, tuple) else df.index[-1]
+    cut = last.to_pydatetime().replace(microsecond=0)
+    if cut <= lo:
+        warnings.warn('{symbol} has more than {limit} ticks at {second}, '
+                      'the remainder of that second is dropped'.format(
+                          symbol=symbol, limit=TICKDATA_ROW_LIMIT, second=lo))
+        cut = lo + timedelta(seconds=1)
+    # The end second of any window but the last is the first second of the next one, which fetches it again
+    if cut > hi or (cut == hi and hi != end):
+        return _ticks_before(df, cut), []
+
+    # Split the remainder assuming the tick density seen so far, with some headroom
+    covered = max((cut - lo).total_seconds(), 1)
+    remaining = (hi - cut).total_seconds()
+    pieces = int(min(max(ceil(1.25 * remaining / covered), 1), max(remaining, 1)))
+    step = timedelta(seconds=ceil(remaining / pieces))
+    starts = [cut + step * i for i in range(pieces) if i == 0 or cut + step * i < hi]
+    return _ticks_before(df, cut), list(zip(starts, starts[1:] + [hi]))
+
+
+def _concat_windows(frames):
+    """
+    Joins the frames of paginated windows, keyed by (beginTime, endTime), in time order. (trades, quotes) tuples are
+    joined per tick type, empty ones keep their typed columns
+    """
+    frames = [frames[window] for window in sorted(frames)]
+    if frames and isinstance(frames[0], tuple):
+        return tuple(pd.concat([part for part in parts if not part.empty] or list(parts[:1]))
+                     for parts in zip(*frames))
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames)
+
+
+def _own_frames(result):
+    # Shallow copy of a DataFrame or of each DataFrame of a tuple, so callers sharing a result can each change theirs
+    if isinstance(result, tuple):
+        return tuple(_own_frames(item) for item in result)
+    return result.copy(deep=False) if isinstance(result, pd.DataFrame) else result
+
+
+def _rows(df):
+    # Rows of a DataFrame or of a tuple of them
+    return sum(len(frame) for frame in df) if isinstance(df, tuple) else len(df)
+
+
+def _ticks_before(df, t):
+    # Rows before t of a DataFrame indexed on datetime, or of each DataFrame of a tuple
+    if isinstance(df, tuple):
+        return tuple(_ticks_before(frame, t) for frame in df)
+    return df[df.index < t] if not df.empty else df
+
+
+def _slice_range(df, begin, end):
+    """
+    Rows of a DataFrame sorted on a DatetimeIndex within [begin, end)
+    """
+    if df.empty:
         return df
+    return df.iloc[df.index.searchsorted(begin):df.index.searchsorted(end)]
+
+
+def _line_blocks(chunks, lines_per_block):
+    """
+    Regroups a byte stream into lists of complete, non empty lines
+    :param chunks:
+    iterator of bytes
+    :param lines_per_block:
+    integer, maximum lines per list
+    :return:
+    generator of lists of lines
+    """
+    block = []
+    partial = b''
+    for chunk in chunks:
+        lines = (partial + chunk).split(b'\n')
+        partial = lines.pop()
+        block += [line.rstrip(b'\r') for line in lines if line.strip()]
+        while len(block) >= lines_per_block:
+            yield block[:lines_per_block]
+            block = block[lines_per_block:]
+    if partial.strip():
+        block.append(partial.rstrip(b'\r'))
+    if block:
+        yield block
+
+
+def _batch_lines(lines, batch_size, batch_interval):
+    """
+    Groups an iterator of lines into lists bounded by a count and a time window. Lines are read on a thread, so
+    a batch is flushed batch_interval seconds after its first line arrived even when no further line comes
+    :param lines:
+    iterator of lines
+    :param batch_size:
+    integer, maximum lines per batch
+    :param batch_interval:
+    float, seconds after the arrival of the first line of a batch at which it is flushed
+    :return:
+    generator of lists of lines
+    """
+    ready = Condition()
+    # Lines read and not yet batched, arrival time of the first of them, exception or None once lines ended
+    pending = []
+    first = [monotonic()]
+    ended = []
+    closed = []
+
+    def __read():
+        # Lines are appended without the lock, which is only taken to wake the consumer or wait for it
+        error = None
+        try:
+            for line in lines:
+                if closed:
+                    return
+                pending.append(line)
+                count = len(pending)
+                if count == 1 or count % batch_size == 0:
+                    with ready:
+                        if count == 1:
+                            first[0] = monotonic()
+                        ready.notify_all()
+
+                        # The reader stays at most a few batches ahead of a slow consumer
+                        while len(pending) >= 4 * batch_size and not closed:
+                            ready.wait()
+        except Exception as e:
+            error = e
+        with ready:
+            ended.append(error)
+            ready.notify_all()
+
+    Thread(target=__read, name='batch_lines', daemon=True).start()
+    try:
+        while True:
+            with ready:
+                while not ended and len(pending) < batch_size and \
+                        (not pending or monotonic() < first[0] + batch_interval):
+                    ready.wait(None if not pending else first[0] + batch_interval - monotonic())
+                batch = pending[:batch_size]
+                del pending[:batch_size]
+                if pending:
+                    first[0] = monotonic()
+                done = bool(ended) and not pending
+                ready.notify_all()
+            if batch:
+                yield batch
+            if done:
+                if ended[0] is not None:
+                    raise ended[0]
+                return
+    finally:
+        with ready:
+            closed.append(True)
+            ready.notify_all()
+
+
+from . async_client import AsyncActiveTick
+from . stream_hub import StreamHub
+from . live_table import QuoteTable
+from . recorder import StreamRecorder, StreamReplay
 
 __version__ = '0.12.1'
 __url__ = 'https://github.com/uberscientist/activetick_http'
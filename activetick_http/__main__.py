@@ -0,0 +1,4 @@
+from . backfill import main
+import sys
+
+sys.exit(main())
@@ -0,0 +1,212 @@
+from . import ActiveTick, HISTORY_TYPES, QUOTEDATA_URL_LENGTH, _intraday_minutes_attr, _page_window, _concat_windows
+from . parsers import parse_quote_data, parse_bar_data, parse_tick_data, parse_option_chain, parse_stream_tick, \
+    parse_stream_batch
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from time import monotonic
+import pandas as pd
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncActiveTick:
+    """
+    asyncio counterpart of ActiveTick, every request is an awaitable and quoteStream is an async iterator.
+    HTTP is done with aiohttp over a connection pool of max_connections, CSV parsing runs in a thread pool
+    so it never blocks the event loop. The cache is not used, requests always go to the proxy.
+
+    # Example
+    async with AsyncActiveTick() as at:
+        bars, quotes = await asyncio.gather(at.barData('INTC'), at.quoteData('SPY', 'LastPrice'))
+        async for tick in at.quoteStream(('SPY', 'VXX')):
+            print(tick)
+    """
+    def __init__(self, host='127.0.0.1', port=5000, max_connections=100, parse_workers=None):
+        if aiohttp is None:
+            raise ImportError('AsyncActiveTick requires aiohttp, install with pip install activetick_http[async]')
+
+        # URL building is shared with the blocking client
+        self._at = ActiveTick(host=host, port=port)
+
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self._executor = ThreadPoolExecutor(max_workers=parse_workers)
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._executor.shutdown(wait=False)
+
+    def _client(self):
+        # The session has to be created from within the running event loop
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
+        return self._session
+
+    async def _get(self, url):
+        async with self._client().get(url) as res:
+            res.raise_for_status()
+            return await res.read()
+
+    async def _parse(self, parser, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, partial(parser, *args))
+
+    async def quoteData(self, symbols, quoteFields, meta=True, max_url_length=QUOTEDATA_URL_LENGTH):
+        """
+        See ActiveTick.quoteData, symbol chunks are requested concurrently
+        """
+        names, dtypes, usecols = self._at._quoteDataColumns(quoteFields, meta)
+
+        async def __request(url):
+            return await self._parse(parse_quote_data, await self._get(url), names, dtypes, usecols)
+
+        frames = await asyncio.gather(*[__request(url) for url in
+                                        self._at._quoteDataUrls(symbols, quoteFields, max_url_length)])
+        return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+    async def barData(self, symbol, historyType='I', intradayMinutes=60,
+                      beginTime=datetime(datetime.now().year, datetime.now().month, 1), endTime=datetime.now()):
+        """
+        See ActiveTick.barData
+        """
+        url = self._at._barDataUrl(symbol, HISTORY_TYPES[historyType],
+                                   _intraday_minutes_attr(historyType, intradayMinutes),
+                                   self._at._date_wrap(beginTime), self._at._date_wrap(endTime))
+        return await self._parse(parse_bar_data, await self._get(url))
+
+    async def tickData(self, symbol, trades=False, quotes=True,
+                       beginTime=datetime.now() - timedelta(minutes=15),
+                       endTime=datetime.now(), paginate=True, split=False):
+        """
+        See ActiveTick.tickData, truncated windows are split and fetched concurrently
+        """
+        if not trades and not quotes:
+            return pd.DataFrame()
+
+        split = split and trades and quotes
+        date_fmt = self._at._date_fmt
+        begin = datetime.strptime(self._at._date_wrap(beginTime), date_fmt)
+        end = datetime.strptime(self._at._date_wrap(endTime), date_fmt)
+
+        async def __request(lo, hi):
+            url = self._at._tickDataUrl(symbol, trades, quotes, lo.strftime(date_fmt), hi.strftime(date_fmt))
+            return await self._parse(parse_tick_data, await self._get(url), trades, quotes, split)
+
+        if not paginate:
+            return await __request(begin, end)
+
+        windows = [(begin, end)]
+        frames = {}
+        while windows:
+            results = await asyncio.gather(*[__request(lo, hi) for lo, hi in windows])
+            pages = list(zip(windows, results))
+            windows = []
+            for (lo, hi), df in pages:
+                frames[lo, hi], more = _page_window(df, lo, hi, end, symbol)
+                windows += more
+        return _concat_windows(frames)
+
+    async def optionChain(self, symbol):
+        """
+        See ActiveTick.optionChain
+        """
+        return await self._parse(parse_option_chain, await self._get(self._at._optionChainUrl(symbol)))
+
+    async def quoteStream(self, symbols, timeout=None):
+        """
+        Async iterator over the quoteStream, yields the same one row DataFrames as ActiveTick.quoteStream
+        :param timeout:
+        seconds to keep the connection open, None to stream until closed
+        """
+        async for line in self._stream_lines(symbols, timeout):
+            yield await self._parse(parse_stream_tick, line)
+
+    async def quoteStreamBatches(self, symbols, batch_size=5000, batch_interval=0.25, timeout=None):
+        """
+        Async iterator over micro-batches of the quoteStream, see ActiveTick.quoteStreamBatches. Lines are read by
+        a separate task, so a batch is flushed batch_interval seconds after its first line even on a quiet stream
+        :return:
+        (quotes, trades) tuples of pandas.DataFrame
+        """
+        # Lines read and not yet batched, arrival time of the first of them, exception or None once lines ended
+        pending = []
+        first = [monotonic()]
+        ended = []
+        ready = asyncio.Event()
+        drained = asyncio.Event()
+
+        async def __read():
+            error = None
+            try:
+                async for line in self._stream_lines(symbols, timeout):
+                    pending.append(line)
+                    if len(pending) == 1:
+                        first[0] = monotonic()
+                        ready.set()
+                    elif len(pending) % batch_size == 0:
+                        ready.set()
+
+                    # The reader stays at most a few batches ahead of a slow consumer
+                    while len(pending) >= 4 * batch_size:
+                        drained.clear()
+                        await drained.wait()
+            except Exception as e:
+                error = e
+            ended.append(error)
+            ready.set()
+
+        reader = asyncio.ensure_future(__read())
+        try:
+            while True:
+                while not ended and len(pending) < batch_size:
+                    wait = None if not pending else first[0] + batch_interval - monotonic()
+                    if wait is not None and wait <= 0:
+                        break
+                    ready.clear()
+                    try:
+                        await asyncio.wait_for(ready.wait(), wait)
+                    except asyncio.TimeoutError:
+                        break
+                batch = pending[:batch_size]
+                del pending[:batch_size]
+                if pending:
+                    first[0] = monotonic()
+                drained.set()
+                done = bool(ended) and not pending
+                if batch:
+                    yield await self._parse(parse_stream_batch, batch)
+                if done:
+                    if ended[0] is not None:
+                        raise ended[0]
+                    return
+        finally:
+            reader.cancel()
+
+    async def _stream_lines(self, symbols, timeout):
+        # Non-empty lines of the stream, the first (acknowledgement) line is skipped like ActiveTick._open_stream
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with self._client().get(self._at._quoteStreamUrl(symbols), timeout=client_timeout) as res:
+            res.raise_for_status()
+            first_line = True
+            async for line in res.content:
+                line = line.rstrip(b'\r\n')
+                if not line:
+                    continue
+                if first_line:
+                    first_line = False
+                    continue
+                yield line
@@ -0,0 +1,244 @@
+from . import ActiveTick, CACHE_SETTLE_TIME, HISTORY_TYPES, __version__
+from . local_store import LocalStore
+from . segments import DAY, YEAR, segment_bounds
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from threading import Lock
+import argparse
+import os
+import sys
+"""
+Resumable historical backfill
+
+Splits a backfill into one job per symbol, data type and trading day (one per symbol for daily and weekly bars).
+Jobs run concurrently over the client's bounded connection pool, responses are parsed in a process pool and
+written to the client's cache, every finished job is appended to a checkpoint file so an interrupted run resumes
+where it stopped.
+
+usage: python -m activetick_http SPY INTC --begin 2016-01-01 --end 2016-12-31 --bars 1 --ticks both \
+--store /data/activetick
+"""
+
+DATE_FMT = '%Y-%m-%d'
+
+TICK_TYPES = {
+    'trades': (True, False),
+    'quotes': (False, True),
+    'both': (True, True)
+}
+
+
+class Checkpoint:
+    """
+    Append-only file of finished job keys, one per line. Lines are flushed as jobs finish, a partly written
+    last line after a crash is ignored
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = set(line[:-1] for line in f if line.endswith('\n'))
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def add(self, key):
+        with self._lock:
+            self._file.write(key + '\n')
+            self._file.flush()
+            self.done.add(key)
+
+    def close(self):
+        self._file.close()
+
+
+def schedule_jobs(symbols, begin, end, bars=(), ticks=None, now=None):
+    """
+    :param begin:
+    datetime, first day of the backfill
+    :param end:
+    datetime, last day of the backfill, inclusive
+    :param bars:
+    iter of bar sizes, intraday minutes as integers or 'D' and 'W'
+    :param ticks:
+    'trades', 'quotes', 'both' or None
+    :param now:
+    datetime in exchange time, data the cache would not keep yet at that time is left out (see settled_until),
+    None to schedule every day
+    :return:
+    list of (symbol, data type, begin, end) jobs, ranges half open, weekends skipped
+    """
+    days = []
+    day = datetime(begin.year, begin.month, begin.day)
+    while day <= end:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+
+    if not days:
+        return []
+
+    types = ['bars:{size}'.format(size=size) for size in bars] + (['ticks:' + ticks] if ticks is not None else [])
+    jobs = []
+    for symbol in symbols:
+        for data in types:
+            settled = settled_until(now, data) if now is not None else days[-1] + timedelta(days=1)
+            if data in ('bars:D', 'bars:W'):
+                last = min(days[-1] + timedelta(days=1), settled)
+                if last > days[0]:
+                    jobs.append((symbol, data, days[0], last))
+            else:
+                jobs += [(symbol, data, day, day + timedelta(days=1)) for day in days
+                         if day + timedelta(days=1) <= settled]
+    return jobs
+
+
+def settled_until(now, data):
+    """
+    :param now:
+    datetime in exchange time
+    :param data:
+    data type of a job, such as 'bars:1' or 'ticks:both'
+    :return:
+    datetime up to which the cache keeps that data type at now, see ActiveTick._segmentCached
+    """
+    settled = now - CACHE_SETTLE_TIME
+    if data in ('bars:D', 'bars:W'):
+        return segment_bounds(settled, YEAR)[1]
+    if data.startswith('bars:'):
+        return segment_bounds(settled, DAY)[1]
+    return settled.replace(microsecond=0)
+
+
+def job_key(job):
+    symbol, data, begin, end = job
+    return '{symbol} {data} {begin:%Y%m%d} {end:%Y%m%d}'.format(symbol=symbol, data=data, begin=begin, end=end)
+
+
+def run_job(at, job):
+    """
+    Fetches one job through the client, which stores it in its cache
+    :return:
+    number of rows fetched
+    """
+    symbol, data, begin, end = job
+    kind, arg = data.split(':')
+    last = end - timedelta(seconds=1)
+    if kind == 'bars':
+        if arg in HISTORY_TYPES:
+            df = at.barData(symbol, arg, 0, begin, last)
+        else:
+            df = at.barData(symbol, 'I', int(arg), begin, last)
+    else:
+        trades, quotes = TICK_TYPES[arg]
+        df = at._tickData(symbol, trades, quotes, begin, last, paginate=True)
+    return len(df)
+
+
+def backfill(at, jobs, checkpoint, workers=None, progress=None):
+    """
+    Runs the jobs not in the checkpoint, jobs that fail are reported and left for the next run, as are jobs
+    reaching past the data the cache keeps yet
+    :param at:
+    ActiveTick with a cache, ideally with a parse_executor
+    :param checkpoint:
+    Checkpoint
+    :param workers:
+    integer, jobs run at the same time, defaults to at.max_connections
+    :param progress:
+    function (done, total, job, error) called after every job
+    :return:
+    (finished, failed) job counts
+    """
+    pending = [job for job in jobs if job_key(job) not in checkpoint]
+    finished = failed = 0
+    with ThreadPoolExecutor(max_workers=workers or at.max_connections) as pool:
+        futures = {pool.submit(run_job, at, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            error = future.exception()
+            if error is None:
+                if job[3] <= settled_until(at.clock(), job[1]):
+                    checkpoint.add(job_key(job))
+                finished += 1
+            else:
+                failed += 1
+            if progress is not None:
+                progress(finished + failed, len(pending), job, error)
+    return finished, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='activetick-backfill',
+                                     description='Resumable backfill of barData and tickData into a LocalStore or '
+                                                 'Redis, rerun the same command to resume')
+    parser.add_argument('symbols', nargs='*', help='symbols to backfill')
+    parser.add_argument('--symbols-file', help='file of symbols, one per line')
+    parser.add_argument('--begin', required=True, help='first day, YYYY-MM-DD')
+    parser.add_argument('--end', required=True, help='last day, YYYY-MM-DD')
+    parser.add_argument('--bars', action='append', default=[],
+                        help='bar size, intraday minutes or D or W, can be repeated')
+    parser.add_argument('--ticks', choices=sorted(TICK_TYPES), help='tick types to backfill')
+    parser.add_argument('--store', help='LocalStore directory the data is written to')
+    parser.add_argument('--redis', help='Redis host[:port] the data is written to')
+    parser.add_argument('--host', default='127.0.0.1', help='HTTP proxy host')
+    parser.add_argument('--port', type=int, default=5000, help='HTTP proxy port')
+    parser.add_argument('--connections', type=int, default=8, help='concurrent proxy requests')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='parsing processes, 0 for none')
+    parser.add_argument('--checkpoint', help='file of finished jobs, defaults to backfill.checkpoint in --store')
+    parser.add_argument('--version', action='version', version=__version__)
+    args = parser.parse_args(argv)
+
+    symbols = list(args.symbols)
+    if args.symbols_file:
+        with open(args.symbols_file, encoding='utf-8') as f:
+            symbols += [line.strip() for line in f if line.strip()]
+    if not symbols:
+        parser.error('no symbols given')
+    if not args.bars and args.ticks is None:
+        parser.error('nothing to backfill, give --bars and/or --ticks')
+    if (args.store is None) == (args.redis is None):
+        parser.error('give one of --store or --redis')
+    if args.checkpoint is None and args.store is None:
+        parser.error('--checkpoint is required with --redis')
+
+    if args.store is not None:
+        cache = LocalStore(args.store)
+    else:
+        from redis import StrictRedis
+        host, _, port = args.redis.partition(':')
+        cache = StrictRedis(host=host, port=int(port or 6379))
+
+    bars = [size if size in ('D', 'W') else int(size) for size in args.bars]
+
+    def __progress(done, total, job, error):
+        if error is not None:
+            print('failed {job}: {error}'.format(job=job_key(job), error=error), file=sys.stderr)
+        if error is not None or done % 100 == 0 or done == total:
+            print('{done}/{total} jobs'.format(done=done, total=total), file=sys.stderr)
+
+    # Workers are spawned rather than forked, the fetching threads are already running when they start
+    executor = ProcessPoolExecutor(args.processes, mp_context=get_context('spawn')) if args.processes else None
+    at = ActiveTick(host=args.host, port=args.port, cache=cache, max_connections=args.connections,
+                    parse_executor=executor)
+    jobs = schedule_jobs(symbols, datetime.strptime(args.begin, DATE_FMT), datetime.strptime(args.end, DATE_FMT),
+                         bars, args.ticks, now=at.clock())
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.store, 'backfill.checkpoint'))
+    try:
+        finished, failed = backfill(at, jobs, checkpoint, progress=__progress)
+    finally:
+        checkpoint.close()
+        if executor is not None:
+            executor.shutdown()
+
+    print('{finished} jobs finished, {failed} failed, {skipped} already done'.format(
+        finished=finished, failed=failed, skipped=len(jobs) - finished - failed), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
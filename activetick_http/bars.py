@@ -0,0 +1,170 @@
+from . parsers import BAR_NAMES, BAR_DTYPES
+from datetime import datetime, timedelta
+import pandas as pd
+import numpy as np
+"""
+Live OHLCV bars built from quoteStream trades
+
+Bars are labelled with their start time and aligned on multiples of their size from midnight, the same
+boundaries as the intraday bars returned by barData.
+
+These classes and functions are for
+activetick.py : quoteStream, quoteStreamBatches, StreamHub, barData(derive=True)
+"""
+
+
+class BarBuilder:
+    """
+    Aggregates trade ticks into bars of several sizes for any number of symbols. Each trade updates the open
+    bar of every size in constant time, a bar is completed by the first trade of its symbol past its end or by
+    flush, completed bars are collected until pop_bars
+
+    # Example
+    builder = BarBuilder(minutes=(1, 5, 15))
+    for tick in hub.subscribe(('SPY', 'VXX')):
+        builder.update(tick)
+        for symbol, df in builder.pop_bars(1).groupby(level='symbol'):
+            print(df)
+    """
+    def __init__(self, minutes=(1,)):
+        """
+        :param minutes:
+        iter of bar sizes in minutes
+        """
+        self.minutes = tuple(minutes)
+
+        # (symbol, minutes): [start, end, open, high, low, close, volume]
+        self._open = {}
+        # minutes: list of (symbol, start, open, high, low, close, volume)
+        self._completed = {size: [] for size in self.minutes}
+
+    def update(self, tick):
+        """
+        Adds one tick, QuoteTick or TradeTick from parsers.parse_tick, quotes are ignored
+        """
+        if tick.type == 'T':
+            self.add_trade(tick.symbol, tick.datetime, tick.last, tick.lastz)
+
+    def update_frame(self, df):
+        """
+        Adds the trades of a quoteStream frame, indexed on type, or of a (quotes, trades) tuple from
+        quoteStreamBatches
+        """
+        if isinstance(df, tuple):
+            df = df[1]
+        if df.index.name == 'type' or 'type' in df:
+            types = df.index if df.index.name == 'type' else df['type']
+            df = df[np.asarray(types == 'T')]
+        if df.empty:
+            return
+
+        # Datetimes as datetime objects, so each trade is compared without pandas
+        times = pd.to_datetime(df['datetime']).values.astype('datetime64[us]').tolist()
+        for symbol, t, price, size in zip(df['symbol'].tolist(), times, df['last'].tolist(), df['lastz'].tolist()):
+            self.add_trade(symbol, t, price, size)
+
+    def add_trade(self, symbol, t, price, size):
+        """
+        :param t:
+        datetime of the trade
+        :param price:
+        float, trade price
+        :param size:
+        integer, trade size
+        """
+        for minutes in self.minutes:
+            key = (symbol, minutes)
+            bar = self._open.get(key)
+            if bar is not None and t < bar[1]:
+                if price > bar[3]:
+                    bar[3] = price
+                elif price < bar[4]:
+                    bar[4] = price
+                bar[5] = price
+                bar[6] += size
+                continue
+
+            if bar is not None:
+                self._completed[minutes].append((symbol, bar[0], bar[2], bar[3], bar[4], bar[5], bar[6]))
+            start = _bar_start(t, minutes)
+            self._open[key] = [start, start + timedelta(minutes=minutes), price, price, price, price, size]
+
+    def flush(self, now=None):
+        """
+        Completes the open bars ending at or before now, for symbols that stopped trading
+        :param now:
+        datetime, None to complete every open bar
+        """
+        for key, bar in list(self._open.items()):
+            if now is None or bar[1] <= now:
+                symbol, minutes = key
+                self._completed[minutes].append((symbol, bar[0], bar[2], bar[3], bar[4], bar[5], bar[6]))
+                del self._open[key]
+
+    def pop_bars(self, minutes=None):
+        """
+        Completed bars of one size, removed from the builder
+        :param minutes:
+        integer bar size, None for the first size given to the builder
+        :return:
+        pandas.DataFrame indexed on (symbol, datetime) with the barData columns and dtypes
+        """
+        minutes = self.minutes[0] if minutes is None else minutes
+        bars, self._completed[minutes] = self._completed[minutes], []
+        return _bar_frame(bars)
+
+    def open_bars(self, minutes=None):
+        """
+        Bars still forming, same format as pop_bars
+        """
+        minutes = self.minutes[0] if minutes is None else minutes
+        return _bar_frame([(symbol,) + tuple(bar[:1] + bar[2:]) for (symbol, size), bar in self._open.items()
+                           if size == minutes])
+
+
+def resample_bars(df, minutes):
+    """
+    Combines bars into larger ones aligned on multiples of minutes from midnight and labelled with their
+    start, the boundaries of barData intraday bars. Periods without bars produce no row
+    :param df:
+    pandas.DataFrame OHLCV indexed on datetime in time order, as returned by barData
+    :param minutes:
+    integer size of the new bars, 1440 for daily bars
+    :return:
+    pandas.DataFrame OHLCV indexed on datetime with the barData dtypes
+    """
+    if df.empty:
+        return df
+
+    # Bar of every row as minutes since the epoch, counted in bars from the midnight of its day like _bar_start,
+    # rows of one bar are consecutive
+    t = df.index.values.astype('datetime64[m]').astype(np.int64)
+    days = t // 1440 * 1440
+    bins = days + (t - days) // minutes * minutes
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    ends = np.r_[starts[1:], len(bins)] - 1
+
+    index = pd.DatetimeIndex(bins[starts].astype('datetime64[m]').astype('datetime64[ns]'), name='datetime')
+    return pd.DataFrame({
+        'open': df['open'].values[starts],
+        'high': np.maximum.reduceat(df['high'].values, starts),
+        'low': np.minimum.reduceat(df['low'].values, starts),
+        'close': df['close'].values[ends],
+        'volume': np.add.reduceat(df['volume'].values.astype(np.uint64), starts)
+    }, index=index).astype({name: BAR_DTYPES[name] for name in BAR_NAMES[1:]})
+
+
+def _bar_start(t, minutes):
+    # Start of the bar containing t, bars are aligned on multiples of their size from midnight
+    day = datetime(t.year, t.month, t.day)
+    seconds = minutes * 60
+    return day + timedelta(seconds=int((t - day).total_seconds() // seconds * seconds))
+
+
+def _bar_frame(bars):
+    # Rows of (symbol, start, open, high, low, close, volume) as a DataFrame typed like parse_bar_data
+    columns = list(zip(*bars)) if bars else [()] * 7
+    index = pd.MultiIndex.from_arrays([list(columns[0]), pd.DatetimeIndex(list(columns[1]), dtype='datetime64[ns]')],
+                                      names=['symbol', 'datetime'])
+    return pd.DataFrame({name: np.array(values, dtype=BAR_DTYPES[name])
+                         for name, values in zip(BAR_NAMES[1:], columns[2:])}, index=index)
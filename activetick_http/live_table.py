@@ -0,0 +1,129 @@
+import pandas as pd
+import numpy as np
+"""
+Live top of book state for streamed symbols
+
+Each column is a preallocated numpy array and each symbol owns one slot (row) in them, so a tick is
+applied in constant time and memory does not grow with the length of the stream.
+"""
+
+COLUMN_DTYPES = {
+    'bid': np.float32,
+    'ask': np.float32,
+    'bidz': np.uint32,
+    'askz': np.uint32,
+    'quote_datetime': 'datetime64[ns]',
+    'last': np.float32,
+    'lastz': np.uint32,
+    'trade_datetime': 'datetime64[ns]'
+}
+
+
+class QuoteTable:
+    """
+    Latest bid/ask/last per symbol, updated in place from quoteStream, quoteStreamBatches or StreamHub ticks
+
+    # Example
+    table = QuoteTable()
+    for tick in at.quoteStream(('SPY', 'VXX')):
+        table.update_frame(tick)
+    print(table.snapshot())
+    """
+    def __init__(self, symbols=(), capacity=256):
+        """
+        :param symbols:
+        iter of symbols to allocate slots for up front, others get a slot on their first tick
+        :param capacity:
+        integer, initial number of slots, doubled whenever it runs out
+        """
+        self._slots = {}
+        self._symbols = []
+        self._columns = {name: self._empty(name, max(capacity, len(symbols), 1)) for name in COLUMN_DTYPES}
+        for symbol in symbols:
+            self.slot(symbol)
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def _empty(self, name, size):
+        # Prices are NaN and datetimes NaT until the first tick, sizes 0
+        dtype = np.dtype(COLUMN_DTYPES[name])
+        if dtype.kind == 'f':
+            return np.full(size, np.nan, dtype=dtype)
+        if dtype.kind == 'M':
+            return np.full(size, np.datetime64('NaT'), dtype=dtype)
+        return np.zeros(size, dtype=dtype)
+
+    def slot(self, symbol):
+        """
+        Row of a symbol, allocated on first use
+        :return:
+        integer
+        """
+        slot = self._slots.get(symbol)
+        if slot is None:
+            slot = len(self._symbols)
+            capacity = len(self._columns['bid'])
+            if slot == capacity:
+                for name, values in self._columns.items():
+                    grown = self._empty(name, capacity * 2)
+                    grown[:capacity] = values
+                    self._columns[name] = grown
+            self._slots[symbol] = slot
+            self._symbols.append(symbol)
+        return slot
+
+    def update(self, tick):
+        """
+        Applies one QuoteTick or TradeTick, see parsers.parse_tick
+        """
+        slot = self.slot(tick.symbol)
+        columns = self._columns
+        if tick.type == 'Q':
+            columns['bid'][slot] = tick.bid
+            columns['ask'][slot] = tick.ask
+            columns['bidz'][slot] = tick.bidz
+            columns['askz'][slot] = tick.askz
+            columns['quote_datetime'][slot] = tick.datetime
+        else:
+            columns['last'][slot] = tick.last
+            columns['lastz'][slot] = tick.lastz
+            columns['trade_datetime'][slot] = tick.datetime
+
+    def update_frame(self, df):
+        """
+        Applies a quoteStream frame, indexed on type, or a (quotes, trades) tuple from quoteStreamBatches.
+        Only the last tick of every symbol in the frame is written.
+        """
+        if isinstance(df, tuple):
+            for frame in df:
+                self.update_frame(frame)
+            return
+        if df.empty:
+            return
+
+        types = df.index if df.index.name == 'type' else df['type']
+        for tag, names, datetime_column in (('Q', ['bid', 'ask', 'bidz', 'askz'], 'quote_datetime'),
+                                            ('T', ['last', 'lastz'], 'trade_datetime')):
+            ticks = df[np.asarray(types == tag)]
+            if ticks.empty:
+                continue
+            ticks = ticks.drop_duplicates('symbol', keep='last')
+            slots = np.fromiter((self.slot(symbol) for symbol in ticks['symbol']), dtype=np.int64, count=len(ticks))
+            for name in names:
+                self._columns[name][slots] = ticks[name].values
+            self._columns[datetime_column][slots] = ticks['datetime'].values
+
+    def snapshot(self, copy=False):
+        """
+        Current state as a DataFrame indexed on symbol
+        :param copy:
+        Boolean, when False the columns are views of the live arrays and change with later ticks
+        (until the table grows), copy for a frozen snapshot
+        :return:
+        pandas.DataFrame with the columns bid, ask, bidz, askz, quote_datetime, last, lastz, trade_datetime
+        """
+        size = len(self._symbols)
+        data = {name: values[:size] for name, values in self._columns.items()}
+        return pd.DataFrame(data, index=pd.Index(self._symbols, name='symbol'), columns=list(COLUMN_DTYPES),
+                            copy=copy)
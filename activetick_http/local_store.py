@@ -0,0 +1,133 @@
+from urllib.parse import quote
+import numpy as np
+import os
+import tempfile
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+"""
+Disk cache backend
+
+Stores every cache segment in its own Arrow IPC file, partitioned by data type, symbol and trading day
+(year for daily and weekly bars), and reads them back through memory maps so only the pages of the rows and
+columns used are loaded.
+
+These classes are for
+activetick.py : ActiveTick(cache=LocalStore(...))
+"""
+
+
+class LocalStore:
+    """
+    Cache backend for ActiveTick keeping data on disk instead of in RAM. Cache keys map to paths, for example
+    AT:TICKDATA:SPY:1:1:20160928 is stored in root/TICKDATA/SPY/1/1/20160928.arrow
+
+    # Example
+    at = ActiveTick(cache=LocalStore('/data/activetick'))
+    """
+    def __init__(self, root, compression=None):
+        """
+        :param root:
+        directory the partitions are written under, created if missing
+        :param compression:
+        None, 'lz4' or 'zstd', compressed files are smaller but are decompressed into memory when read
+        """
+        if pa is None:
+            raise ImportError('LocalStore requires pyarrow, install with pip install activetick_http[arrow]')
+        self.root = root
+        self.compression = compression
+        self._options = pa.ipc.IpcWriteOptions(compression=compression)
+        os.makedirs(root, exist_ok=True)
+
+    def get(self, key):
+        """
+        Raw value of a key, like redis get
+        :return:
+        bytes or None if key is not stored
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        """
+        Stores a raw value, like redis set
+        :param value:
+        bytes or string
+        """
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        with self._open_atomic(self._path(key)) as f:
+            f.write(value)
+
+    def delete(self, key):
+        for path in (self._path(key), self._path(key) + '.arrow'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get_frame(self, key, begin=None, end=None, columns=None):
+        """
+        Reads a DataFrame through a memory map, numeric columns of uncompressed files are not copied
+        :param begin:
+        datetime, with end only the rows within [begin, end) of a frame indexed on datetime are read
+        :param columns:
+        list of column names to read, None for all
+        :return:
+        pandas.DataFrame or None if key is not stored
+        """
+        try:
+            source = pa.memory_map(self._path(key) + '.arrow')
+        except FileNotFoundError:
+            return None
+        table = pa.ipc.open_file(source).read_all()
+
+        index_columns = [c for c in table.schema.pandas_metadata['index_columns'] if isinstance(c, str)]
+        if begin is not None and index_columns:
+            index = table.column(index_columns[0]).to_numpy()
+            lo, hi = np.searchsorted(index, [np.datetime64(begin), np.datetime64(end)])
+            table = table.slice(lo, hi - lo)
+        if columns is not None:
+            table = table.select(list(columns) + index_columns)
+        return table.to_pandas(split_blocks=True)
+
+    def set_frame(self, key, df):
+        """
+        Writes a DataFrame, replacing any stored under key
+        """
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        with self._open_atomic(self._path(key) + '.arrow') as f:
+            with pa.ipc.new_file(f, table.schema, options=self._options) as writer:
+                writer.write_table(table)
+
+    def _path(self, key):
+        parts = key.split(':')
+        if parts[0] == 'AT':
+            parts = parts[1:]
+        return os.path.join(self.root, *[quote(part, safe='') for part in parts])
+
+    def _open_atomic(self, path):
+        # Written next to the destination then renamed, so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        return _AtomicFile(os.fdopen(fd, 'wb'), tmp_path, path)
+
+
+class _AtomicFile:
+    def __init__(self, f, tmp_path, path):
+        self.f = f
+        self.tmp_path = tmp_path
+        self.path = path
+
+    def __enter__(self):
+        return self.f
+
+    def __exit__(self, exc_type, exc, tb):
+        self.f.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
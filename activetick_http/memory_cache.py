@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+import sys
+import pandas as pd
+"""
+In-process cache tier
+
+Keeps recently used cache values (decoded DataFrames and segment coverage) in memory in front of the
+cache backend, so repeated hits skip both the network round trip and decoding.
+
+These classes are for
+activetick.py : ActiveTick(memory_cache=...)
+"""
+
+
+class MemoryCache:
+    """
+    Least recently used cache bounded by the total size of its values in bytes, with an optional time to live.
+    Values are shared, not copied, between callers: DataFrames must be treated as read-only, which pandas
+    copy-on-write guarantees for frames derived from them.
+
+    # Example
+    at = ActiveTick(cache=StrictRedis(), memory_cache=MemoryCache(max_bytes=512 * 2 ** 20, ttl=3600))
+    """
+    def __init__(self, max_bytes=256 * 2 ** 20, ttl=None):
+        """
+        :param max_bytes:
+        integer, the least recently used values are evicted once their total size exceeds this
+        :param ttl:
+        seconds a value stays valid after it is set, None to keep it until evicted
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = Lock()
+        # key: (value, size, expiry)
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        """
+        :return:
+        the value or None if key is not cached or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= monotonic():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl:
+        seconds, overrides the cache ttl for this value
+        """
+        size = _sizeof(value)
+        ttl = self.ttl if ttl is None else ttl
+        expiry = None if ttl is None else monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            # Values larger than the whole cache are not kept
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, expiry)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        value, size, expiry = self._entries.pop(key)
+        self.size -= size
+
+
+def _sizeof(value):
+    # Bytes held by a value, for DataFrames including the index and string data
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(item) for item in value)
+    return sys.getsizeof(value)
@@ -0,0 +1,153 @@
+from . segments import exchange_now
+from datetime import datetime
+from threading import Lock
+from urllib.parse import urlsplit, parse_qs
+import pandas as pd
+"""
+Request, parse, cache and stream instrumentation
+
+ActiveTick(metrics=...) records one value per event, labelled with the endpoint and the symbol it was for.
+Metrics aggregates them in memory and passes every value on to its callbacks, any object with the same
+record method can be used instead, for example to forward values to statsd or Prometheus.
+
+These classes and functions are for
+activetick.py : ActiveTick(metrics=Metrics()), StreamHub
+"""
+
+# Names of the recorded values
+REQUEST_SECONDS = 'request_seconds'
+BYTES = 'bytes'
+ROWS = 'rows'
+PARSE_SECONDS = 'parse_seconds'
+CACHE_HITS = 'cache_hits'
+CACHE_MISSES = 'cache_misses'
+CACHE_READ_SECONDS = 'cache_read_seconds'
+CACHE_WRITE_SECONDS = 'cache_write_seconds'
+ERRORS = 'errors'
+COALESCED = 'coalesced'
+STREAM_TICKS = 'stream_ticks'
+STREAM_LAG_SECONDS = 'stream_lag_seconds'
+
+# quoteStream lines between two stream records, each records the ticks and bytes since the previous one and
+# the lag of one tick
+STREAM_SAMPLE = 100
+
+
+class Metrics:
+    """
+    Registry of count, total, min and max of every value recorded, per (metric, endpoint, symbol)
+
+    # Example
+    metrics = Metrics()
+    at = ActiveTick(metrics=metrics)
+    at.tickData('SPY', trades=True, quotes=True)
+    print(metrics.summary())
+    """
+    def __init__(self, callbacks=(), per_symbol=True, clock=exchange_now):
+        """
+        :param callbacks:
+        iter of functions (metric, endpoint, symbol, value) called with every value recorded
+        :param per_symbol:
+        Boolean, with False values of all symbols are aggregated under the symbol ''
+        :param clock:
+        function returning the current datetime in the timezone of the tick timestamps, stream lag is
+        measured against it. By default the current time in New York, see segments.exchange_now
+        """
+        self.callbacks = list(callbacks)
+        self.per_symbol = per_symbol
+        self.clock = clock
+
+        # (metric, endpoint, symbol): [count, total, min, max]
+        self._stats = {}
+        self._lock = Lock()
+
+    def record(self, metric, endpoint, symbol, value=1):
+        """
+        :param metric:
+        String, one of the names above or any other
+        :param value:
+        number, seconds for timings, 1 for events
+        """
+        if not self.per_symbol:
+            symbol = ''
+        key = (metric, endpoint, symbol)
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                self._stats[key] = [1, value, value, value]
+            else:
+                stat[0] += 1
+                stat[1] += value
+                if value < stat[2]:
+                    stat[2] = value
+                if value > stat[3]:
+                    stat[3] = value
+        for callback in self.callbacks:
+            callback(metric, endpoint, symbol, value)
+
+    def get(self, metric, endpoint, symbol=None):
+        """
+        :param symbol:
+        String, None for the sum over all symbols
+        :return:
+        (count, total) of the values recorded
+        """
+        with self._lock:
+            stats = [stat for key, stat in self._stats.items()
+                     if key[:2] == (metric, endpoint) and symbol in (None, key[2])]
+        return sum(stat[0] for stat in stats), sum(stat[1] for stat in stats)
+
+    def summary(self):
+        """
+        :return:
+        pandas.DataFrame indexed on (metric, endpoint, symbol) with columns count, total, mean, min and max
+        """
+        with self._lock:
+            rows = [key + tuple(stat) for key, stat in self._stats.items()]
+        df = pd.DataFrame(rows, columns=['metric', 'endpoint', 'symbol', 'count', 'total', 'min', 'max'])
+        df.insert(4, 'mean', df['total'] / df['count'])
+        return df.set_index(['metric', 'endpoint', 'symbol']).sort_index()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+def url_labels(url):
+    """
+    :return:
+    (endpoint, symbol) of a proxy URL, symbol is '' for requests of several symbols
+    """
+    parts = urlsplit(url)
+    symbols = parse_qs(parts.query).get('symbol', [''])[0]
+    return parts.path.lstrip('/'), '' if ' ' in symbols or '+' in symbols else symbols
+
+
+def measure_stream(lines, metrics, endpoint='quoteStream', sample=STREAM_SAMPLE):
+    """
+    Passes quoteStream lines through, recording every sample lines the ticks and bytes received and the lag
+    of the last tick, the time between its timestamp and its arrival. The other lines are only counted
+    :param lines:
+    iterator of raw quoteStream lines (bytes)
+    :return:
+    generator of the same lines
+    """
+    clock = getattr(metrics, 'clock', exchange_now)
+    ticks = 0
+    received = 0
+    for line in lines:
+        ticks += 1
+        received += len(line)
+        if ticks == sample:
+            symbol = line.split(b',', 2)[1].decode('utf-8')
+            stamp = line[line.rindex(b',') + 1:]
+            t = datetime(int(stamp[0:4]), int(stamp[4:6]), int(stamp[6:8]), int(stamp[8:10]), int(stamp[10:12]),
+                         int(stamp[12:14]), int(stamp[14:17] or 0) * 1000)
+            metrics.record(STREAM_LAG_SECONDS, endpoint, symbol, (clock() - t).total_seconds())
+            metrics.record(STREAM_TICKS, endpoint, '', ticks)
+            metrics.record(BYTES, endpoint, '', received)
+            ticks = received = 0
+        yield line
+    if ticks:
+        metrics.record(STREAM_TICKS, endpoint, '', ticks)
+        metrics.record(BYTES, endpoint, '', received)
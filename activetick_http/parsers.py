@@ -0,0 +1,438 @@
+from io import BytesIO, StringIO
+from collections import namedtuple
+from datetime import datetime
+import pandas as pd
+import numpy as np
+"""
+Parsers for the raw CSV lines returned by the ActiveTick HTTP proxy
+
+These lookup tables and functions are for
+activetick.py : quoteData, quoteStream, quoteStreamBatches, barData, tickData, optionChain
+"""
+
+# Timestamps are fixed width, with milliseconds for ticks and to the second for bars and queries
+TICK_DATE_FMT = '%Y%m%d%H%M%S%f'
+BAR_DATE_FMT = '%Y%m%d%H%M%S'
+STREAM_DATE_FMT = TICK_DATE_FMT
+
+STREAM_QUOTE_NAMES = ['type', 'symbol', 'cond', 'bid_ex', 'ask_ex', 'bid', 'ask', 'bidz', 'askz', 'datetime']
+STREAM_QUOTE_DTYPES = {
+    'type': object,
+    'symbol': object,
+    'cond': np.uint8,
+    'bid_ex': object,
+    'ask_ex': object,
+    'bid': np.float32,
+    'ask': np.float32,
+    'bidz': np.uint32,
+    'askz': np.uint32,
+    'datetime': np.int64
+}
+
+STREAM_TRADE_NAMES = ['type', 'symbol', 'flags', 'cond1', 'cond2', 'cond3', 'cond4', 'last_ex', 'last', 'lastz',
+                      'datetime']
+STREAM_TRADE_DTYPES = {
+    'type': object,
+    'symbol': object,
+    'flags': object,
+    'cond1': np.int8,
+    'cond2': np.int8,
+    'cond3': np.int8,
+    'cond4': np.int8,
+    'last_ex': object,
+    'last': np.float32,
+    'lastz': np.uint32,
+    'datetime': np.int64
+}
+
+
+# Lightweight quoteStream records, one tuple per tick instead of a one row DataFrame
+QuoteTick = namedtuple('QuoteTick', STREAM_QUOTE_NAMES)
+TradeTick = namedtuple('TradeTick', STREAM_TRADE_NAMES)
+
+# Characters of an option symbol after its root: expiry YYMMDD, C or P, strike times 1000
+OPTION_TAIL_LENGTH = 15
+
+BAR_NAMES = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+BAR_DTYPES = {
+    'datetime': np.int64,
+    'open': np.float32,
+    'high': np.float32,
+    'low': np.float32,
+    'close': np.float32,
+    'volume': np.uint32
+}
+
+TICK_QUOTE_NAMES = ['type', 'datetime', 'bid', 'ask', 'bidz', 'askz', 'bidx', 'askx', 'cond']
+TICK_QUOTE_DTYPES = {
+    'type': object,
+    'datetime': np.int64,
+    'bid': np.float32,
+    'ask': np.float32,
+    'bidz': np.uint32,
+    'askz': np.uint32,
+    'bidx': object,
+    'askx': object,
+    'cond': np.uint8
+}
+
+TICK_TRADE_NAMES = ['type', 'datetime', 'last', 'lastz', 'lastx', 'cond1', 'cond2', 'cond3', 'cond4']
+TICK_TRADE_DTYPES = {
+    'type': object,
+    'datetime': np.int64,
+    'last': np.float32,
+    'lastz': np.uint32,
+    'lastx': object,
+    'cond1': np.uint8,
+    'cond2': np.uint8,
+    'cond3': np.uint8,
+    'cond4': np.uint8
+}
+
+
+def parse_datetime(values, date_format=TICK_DATE_FMT):
+    """
+    Vectorized parser for the fixed width timestamps of the proxy, the digits are split with integer
+    arithmetic instead of calling strptime once per row. Other formats fall back to pandas.to_datetime
+    :param values:
+     array-like of timestamps as integers, bytes or strings, ie 20160928093000091
+    :param date_format:
+     TICK_DATE_FMT or BAR_DATE_FMT
+    :return:
+     numpy array of datetime64[ns]
+    """
+    values = np.asarray(values)
+    if values.dtype.kind not in 'iu':
+        values = values.astype(np.int64)
+    else:
+        values = values.astype(np.int64, copy=False)
+
+    if date_format == TICK_DATE_FMT:
+        width = 17
+    elif date_format == BAR_DATE_FMT:
+        width = 14
+    else:
+        width = None
+    if width is None or (len(values) and (values.min() < 10 ** (width - 1) or values.max() >= 10 ** width)):
+        return pd.to_datetime(values.astype(str), format=date_format).values.astype('datetime64[ns]')
+
+    ns = np.zeros(len(values), dtype=np.int64)
+    if width == 17:
+        values, millis = np.divmod(values, 1000)
+        ns += millis * 1000000
+    values, seconds = np.divmod(values, 100)
+    values, minutes = np.divmod(values, 100)
+    values, hours = np.divmod(values, 100)
+    ns += (hours * 3600 + minutes * 60 + seconds) * 1000000000
+    values, days = np.divmod(values, 100)
+    years, months = np.divmod(values, 100)
+
+    dates = (years - 1970).astype('datetime64[Y]') + (months - 1).astype('timedelta64[M]')
+    dates = dates.astype('datetime64[D]') + (days - 1).astype('timedelta64[D]')
+    return dates.astype('datetime64[ns]') + ns.astype('timedelta64[ns]')
+
+
+def _empty_frame(names, dtypes, index_col):
+    # Typed zero row frame so empty batches keep the same columns as full ones
+    df = pd.DataFrame({name: pd.Series([], dtype=dtypes[name]) for name in names}, columns=names)
+    df['datetime'] = df['datetime'].values.astype('datetime64[ns]')
+    return df.set_index(index_col)
+
+
+def _read_lines(lines, names, dtypes, date_format, index_col):
+    """
+    Reads a list of raw CSV lines of a single tick type with one read_csv call
+    :param lines:
+     list of bytes, each one CSV row without the line ending
+    :return:
+     pandas.DataFrame typed with dtypes, datetime column parsed with date_format
+    """
+    return _read_body(b'\n'.join(lines), names, dtypes, date_format, index_col)
+
+
+def _read_body(body, names, dtypes, date_format, index_col):
+    """
+    Reads CSV rows of a single tick type with one read_csv call
+    :param body:
+     bytes, the rows separated by line endings
+    :return:
+     pandas.DataFrame typed with dtypes, datetime column parsed with date_format
+    """
+    if not body.strip():
+        return _empty_frame(names, dtypes, index_col)
+    df = pd.read_csv(BytesIO(body), header=None, names=names, dtype=dtypes, engine='c')
+    df['datetime'] = parse_datetime(df['datetime'].values, date_format)
+    return df.set_index(index_col)
+
+
+def _line_tags(content):
+    """
+    Finds the lines of a response with numpy rather than splitting it into line objects
+    :param content:
+     bytes
+    :return:
+     (numpy uint8 array viewing content, first byte of every line, length of every line with its ending)
+    """
+    buf = np.frombuffer(content, dtype=np.uint8)
+    starts = np.flatnonzero(buf == ord('\n')) + 1
+    starts = np.r_[0, starts[starts < len(buf)]] if len(buf) else starts[:0]
+    lengths = np.diff(np.r_[starts, len(buf)])
+    return buf, buf[starts], lengths
+
+
+def _select_lines(buf, tags, lengths, tag):
+    """
+    :return:
+     bytes, the lines of buf starting with tag in their original order
+    """
+    return buf[np.repeat(tags == ord(tag), lengths)].tobytes()
+
+
+def parse_quote_data(content, names, dtypes=None, usecols=None):
+    """
+    Parses a quoteData response
+    :param names:
+     column names, see ActiveTick._quoteDataColumns
+    :param dtypes:
+     dict of column dtypes, integer columns holding missing values are read as floats instead
+    :param usecols:
+     list of the columns to read, defaults to all of them
+    :return:
+     pandas.DataFrame indexed on symbol
+    """
+    try:
+        return pd.read_csv(BytesIO(content), header=None, names=names, usecols=usecols, dtype=dtypes,
+                           index_col='symbol')
+    except ValueError:
+
+        # Symbols or fields with a bad status come without values
+        df = pd.read_csv(BytesIO(content), header=None, names=names, usecols=usecols, index_col='symbol')
+        for name, dtype in (dtypes or {}).items():
+            if name in df.columns and np.dtype(dtype).kind in 'iuf':
+                has_missing = np.dtype(dtype).kind != 'f' and df[name].isnull().any()
+                df[name] = df[name].astype(np.float64 if has_missing else dtype)
+        return df
+
+
+def parse_bar_data(content):
+    """
+    Parses a barData response
+    :return:
+     pandas.DataFrame OHLCV indexed on datetime
+    """
+    df = pd.read_csv(BytesIO(content), header=None, names=BAR_NAMES, dtype=BAR_DTYPES)
+    df['datetime'] = parse_datetime(df['datetime'].values, BAR_DATE_FMT)
+    return df.set_index('datetime')
+
+
+def parse_option_chain(content):
+    """
+    Parses an optionChain response, decoding the OCC style symbols in one vectorized pass over the digits of
+    their fixed width tail: OPTION:SPY---161014P00186000 is the SPY put expiring 2016-10-14 with a strike of 186
+    :return:
+     pandas.DataFrame indexed on symbol with columns underlying, expiry (datetime64), right ('C' or 'P') and
+     strike (float64) in response order, lines that are not option symbols are skipped
+    """
+    symbols = [symbol for symbol in content.split() if len(symbol) > OPTION_TAIL_LENGTH]
+    tails = np.array([symbol[-OPTION_TAIL_LENGTH:] for symbol in symbols],
+                     dtype='S{n}'.format(n=OPTION_TAIL_LENGTH)).view(np.uint8).reshape(-1, OPTION_TAIL_LENGTH)
+
+    # Tail is YYMMDD, C or P, then the strike times 1000 on 8 digits
+    digits = tails.astype(np.int64) - ord('0')
+    rights = tails[:, 6]
+    valid = ((digits[:, :6] >= 0) & (digits[:, :6] <= 9)).all(axis=1) & \
+        ((digits[:, 7:] >= 0) & (digits[:, 7:] <= 9)).all(axis=1) & ((rights == ord('C')) | (rights == ord('P')))
+    if not valid.all():
+        symbols = [symbol for symbol, ok in zip(symbols, valid.tolist()) if ok]
+        digits, rights = digits[valid], rights[valid]
+
+    dates = digits[:, :6] @ 10 ** np.arange(5, -1, -1, dtype=np.int64)
+    strikes = digits[:, 7:] @ 10 ** np.arange(7, -1, -1, dtype=np.int64)
+
+    # Few distinct underlyings, each root is decoded once
+    roots, inverse = np.unique(np.array([symbol[:-OPTION_TAIL_LENGTH] for symbol in symbols], dtype=object),
+                               return_inverse=True)
+    roots = np.array([root.split(b':')[-1].rstrip(b'-').decode('utf-8') for root in roots], dtype=object)
+
+    return pd.DataFrame({
+        'underlying': roots[inverse],
+        'expiry': parse_datetime((dates + 20000000) * 1000000, BAR_DATE_FMT),
+        'right': np.where(rights == ord('C'), 'C', 'P').astype(object),
+        'strike': strikes / 1000
+    }, index=pd.Index([symbol.decode('utf-8') for symbol in symbols], dtype=object, name='symbol'))
+
+
+def parse_tick_data(content, trades=False, quotes=True, split=False):
+    """
+    Parses a tickData response. Mixed responses are routed on the leading type tag with numpy index arrays, the
+    lines of each tick type are gathered into one body read once with its own dtypes and, unless split, the two
+    typed frames are interleaved back in response order, which is already time ordered, so no sort is needed.
+    :param content:
+     bytes, body of the tickData response
+    :param trades:
+     Boolean, response contains trade ticks
+    :param quotes:
+     Boolean, response contains quote ticks
+    :param split:
+     Boolean, for mixed responses return the typed (trades, quotes) frames instead of merging them
+    :return:
+     pandas.DataFrame indexed on datetime, or a (trades, quotes) tuple of them when split
+    """
+    if not (trades and quotes):
+        tag = b'T' if trades else b'Q'
+        names, dtypes = (TICK_TRADE_NAMES, TICK_TRADE_DTYPES) if trades else (TICK_QUOTE_NAMES, TICK_QUOTE_DTYPES)
+
+        # Usually every row has the requested type and the body is read as is
+        if content[:1] == tag and content.count(b'\n' + tag) >= content.count(b'\n') - 1:
+            df = pd.read_csv(BytesIO(content), header=None, names=names, dtype=dtypes, engine='c')
+            df['datetime'] = parse_datetime(df['datetime'].values, TICK_DATE_FMT)
+            return df.set_index('datetime')
+        buf, tags, lengths = _line_tags(content)
+        return _read_body(_select_lines(buf, tags, lengths, tag), names, dtypes, TICK_DATE_FMT, 'datetime')
+
+    # Bodies are built and read one tick type at a time, so only one copy of the lines is held at once
+    buf, tags, lengths = _line_tags(content)
+    trades_df = _read_body(_select_lines(buf, tags, lengths, b'T'), TICK_TRADE_NAMES, TICK_TRADE_DTYPES,
+                           TICK_DATE_FMT, 'datetime')
+    quotes_df = _read_body(_select_lines(buf, tags, lengths, b'Q'), TICK_QUOTE_NAMES, TICK_QUOTE_DTYPES,
+                           TICK_DATE_FMT, 'datetime')
+    if split:
+        return trades_df, quotes_df
+    tags = tags[(tags == ord('T')) | (tags == ord('Q'))]
+    return interleave(trades_df, quotes_df, tags == ord('T'))
+
+
+def interleave(first, second, is_first):
+    """
+    Merges two frames into one whose rows follow is_first, a row from first where it is True and the next
+    row of second otherwise, building each column once without concatenating or sorting. Columns missing
+    from one side are filled with NaN, so integer columns become floats.
+    :param first:
+     pandas.DataFrame with is_first.sum() rows
+    :param second:
+     pandas.DataFrame with the remaining rows
+    :param is_first:
+     numpy boolean array, one entry per output row
+    :return:
+     pandas.DataFrame with the columns of first followed by the columns only in second
+    """
+    is_second = ~is_first
+
+    def __merge(first_values, second_values):
+        values = [v for v in (first_values, second_values) if v is not None]
+        kinds = set(v.dtype.kind for v in values)
+        if len(values) == 2 and values[0].dtype == values[1].dtype:
+            dtype = values[0].dtype
+        elif kinds <= set('iuf'):
+            dtype = np.result_type(np.float32, *[v.dtype for v in values])
+        elif kinds == set('M') and len(values) == 2:
+            dtype = values[0].dtype
+        else:
+            dtype = np.dtype(object)
+        merged = np.empty(len(is_first), dtype=dtype)
+        if len(values) == 1:
+            merged.fill(np.datetime64('NaT') if dtype.kind == 'M' else np.nan)
+        if first_values is not None:
+            merged[is_first] = first_values
+        if second_values is not None:
+            merged[is_second] = second_values
+        return merged
+
+    def __column(df, name):
+        return np.asarray(df[name]) if name in df.columns else None
+
+    names = list(first.columns) + [name for name in second.columns if name not in first.columns]
+    index = pd.Index(__merge(np.asarray(first.index), np.asarray(second.index)), name=first.index.name)
+
+    # Columns are added one at a time, so only one merged column is held besides the result
+    df = pd.DataFrame(index=index)
+    for name in names:
+        df[name] = __merge(__column(first, name), __column(second, name))
+    return df
+
+
+def split_ticks(df):
+    """
+    Splits a merged trades and quotes frame, as returned by parse_tick_data, into typed frames
+    :param df:
+     pandas.DataFrame indexed on datetime with a type column
+    :return:
+     (trades, quotes) tuple of pandas.DataFrame with the dtypes of the single type responses
+    """
+    frames = []
+    for tag, names, dtypes in (('T', TICK_TRADE_NAMES, TICK_TRADE_DTYPES), ('Q', TICK_QUOTE_NAMES, TICK_QUOTE_DTYPES)):
+        names = [name for name in names if name != 'datetime']
+        if df.empty:
+            frames.append(_empty_frame(['datetime'] + names, dtypes, 'datetime'))
+            continue
+        typed = df.loc[np.asarray(df['type'] == tag), names]
+        frames.append(typed.astype({name: dtypes[name] for name in names}))
+    return tuple(frames)
+
+
+def parse_stream_tick(tick):
+    """
+    Parses a single quoteStream line
+    :param tick:
+     bytes, one line of the stream
+    :return:
+     one row pandas.DataFrame indexed on type
+    """
+    tick = tick.decode('utf-8')
+    if tick[0] == 'Q':
+        names = STREAM_QUOTE_NAMES
+        dtype = STREAM_QUOTE_DTYPES
+    else:
+        names = STREAM_TRADE_NAMES
+        dtype = STREAM_TRADE_DTYPES
+    df = pd.read_csv(StringIO(tick), names=names, dtype=dtype)
+    df['datetime'] = parse_datetime(df['datetime'].values, STREAM_DATE_FMT)
+    return df.set_index('type')
+
+
+def parse_tick(line):
+    """
+    Parses a single quoteStream line into a QuoteTick or TradeTick, without pandas
+    :param line:
+     bytes, one line of the stream
+    :return:
+     QuoteTick or TradeTick with the stream column names, datetime as a datetime
+    """
+    fields = line.decode('utf-8').split(',')
+    stamp = fields[-1]
+    fields[-1] = datetime(int(stamp[0:4]), int(stamp[4:6]), int(stamp[6:8]), int(stamp[8:10]), int(stamp[10:12]),
+                          int(stamp[12:14]), int(stamp[14:17] or 0) * 1000)
+    if fields[0] == 'Q':
+        fields[2] = int(fields[2])
+        fields[5] = float(fields[5])
+        fields[6] = float(fields[6])
+        fields[7] = int(fields[7])
+        fields[8] = int(fields[8])
+        return QuoteTick(*fields)
+    for i in (3, 4, 5, 6, 9):
+        fields[i] = int(fields[i])
+    fields[8] = float(fields[8])
+    return TradeTick(*fields)
+
+
+def parse_stream_batch(lines):
+    """
+    Parses a batch of quoteStream lines, splitting them on the leading type tag and reading each
+    tick type in a single vectorized pass.
+    :param lines:
+     iterable of raw lines (bytes) as returned by requests iter_lines()
+    :return:
+     tuple of (quotes, trades) pandas.DataFrame with the same columns and dtypes as the frames
+     yielded by quoteStream, in arrival order
+    """
+    quotes = []
+    trades = []
+    for line in lines:
+        tag = line[:1]
+        if tag == b'Q':
+            quotes.append(line)
+        elif tag == b'T':
+            trades.append(line)
+
+    return (_read_lines(quotes, STREAM_QUOTE_NAMES, STREAM_QUOTE_DTYPES, STREAM_DATE_FMT, 'type'),
+            _read_lines(trades, STREAM_TRADE_NAMES, STREAM_TRADE_DTYPES, STREAM_DATE_FMT, 'type'))
@@ -0,0 +1,312 @@
+from . import _batch_lines
+from . parsers import QuoteTick, TradeTick, STREAM_QUOTE_NAMES, STREAM_TRADE_NAMES, parse_stream_tick, parse_tick, \
+    parse_stream_batch
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+import numpy as np
+import os
+import struct
+"""
+Binary quoteStream log
+
+Ticks are appended as fixed size records to one file per trading day, next to the list of symbols seen that day.
+Replay memory maps the files and turns the records back into quoteStream lines, so the live parsers and
+iterators are reused unchanged.
+
+These classes are for
+activetick.py : quoteStream, quoteStreamBatches, StreamHub
+"""
+
+LOG_MAGIC = b'ATTICKS'
+LOG_VERSION = 1
+LOG_HEADER_SIZE = 16
+
+# Quotes and trades share one record, trades keep last, lastz and last_ex in the bid fields and
+# flags and cond1-4 in flags and cond, quotes keep cond in cond[0]. cond holds bytes, the unsigned quote cond
+# as is and the signed trade conds in two's complement
+RECORD_DTYPE = np.dtype([
+    ('datetime', '<i8'),
+    ('symbol', '<u4'),
+    ('bid', '<f4'),
+    ('ask', '<f4'),
+    ('bidz', '<u4'),
+    ('askz', '<u4'),
+    ('type', 'S1'),
+    ('bid_ex', 'S1'),
+    ('ask_ex', 'S1'),
+    ('flags', 'S4'),
+    ('cond', 'u1', (4,))
+])
+_RECORD = struct.Struct('<qIffIIccc4s4B')
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class StreamRecorder:
+    """
+    Appends quoteStream ticks to daily binary logs, root/YYYYmmdd.ticks with the symbols in root/YYYYmmdd.symbols.
+    Records are packed into a buffer written every buffer_size ticks, logs of a day already recorded are appended to
+
+    # Example
+    with StreamRecorder('/data/ticks') as recorder:
+        for tick in hub.subscribe(('SPY', 'VXX')):
+            recorder.record(tick)
+    """
+    def __init__(self, root, buffer_size=10000):
+        """
+        :param root:
+        directory of the logs, created if missing
+        :param buffer_size:
+        integer, ticks kept in memory between writes
+        """
+        self.root = root
+        self.buffer_size = buffer_size
+        os.makedirs(root, exist_ok=True)
+
+        self._buffer = bytearray(_RECORD.size * buffer_size)
+        self._count = 0
+        self._file = None
+        self._day_start = self._day_end = None
+        self._symbol_ids = {}
+        self._new_symbols = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, tick):
+        """
+        Appends one QuoteTick or TradeTick, see parsers.parse_tick
+        """
+        t = tick.datetime
+        if self._file is None or not self._day_start <= t < self._day_end:
+            self._open_day(t)
+
+        symbol = self._symbol_ids.get(tick.symbol)
+        if symbol is None:
+            symbol = self._symbol_ids[tick.symbol] = len(self._symbol_ids)
+            self._new_symbols.append(tick.symbol)
+
+        ns = (t - _EPOCH) // _MICROSECOND * 1000
+        offset = self._count * _RECORD.size
+        if tick.type == 'Q':
+            _RECORD.pack_into(self._buffer, offset, ns, symbol, tick.bid, tick.ask, tick.bidz, tick.askz, b'Q',
+                              tick.bid_ex.encode(), tick.ask_ex.encode(), b'', int(tick.cond), 0, 0, 0)
+        else:
+            _RECORD.pack_into(self._buffer, offset, ns, symbol, tick.last, 0, tick.lastz, 0, b'T',
+                              tick.last_ex.encode(), b'\0', str(tick.flags).encode(),
+                              *[int(cond) & 0xFF for cond in (tick.cond1, tick.cond2, tick.cond3, tick.cond4)])
+        self._count += 1
+        if self._count == self.buffer_size:
+            self.flush()
+
+    def record_frame(self, df):
+        """
+        Appends the ticks of a quoteStream frame, indexed on type, or of a (quotes, trades) tuple from
+        quoteStreamBatches
+        """
+        if isinstance(df, tuple):
+            for frame in df:
+                self.record_frame(frame)
+            return
+        for row in df.reset_index().itertuples(index=False):
+            fields = row._asdict()
+            if fields['type'] == 'Q':
+                self.record(QuoteTick(*[fields[name] for name in STREAM_QUOTE_NAMES]))
+            else:
+                self.record(TradeTick(*[fields[name] for name in STREAM_TRADE_NAMES]))
+
+    def flush(self):
+        """
+        Writes the buffered ticks, symbols first so every record written can be resolved
+        """
+        if self._file is None:
+            return
+        if self._new_symbols:
+            with open(self._day_path + '.symbols', 'a', encoding='utf-8') as f:
+                f.write(''.join(symbol + '\n' for symbol in self._new_symbols))
+            self._new_symbols = []
+        if self._count:
+            self._file.write(memoryview(self._buffer)[:self._count * _RECORD.size])
+            self._file.flush()
+            self._count = 0
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open_day(self, t):
+        # Rotates to the log of the trading day of t, reading the symbols it already has
+        self.close()
+        self._day_start = datetime(t.year, t.month, t.day)
+        self._day_end = self._day_start + timedelta(days=1)
+        self._day_path = os.path.join(self.root, self._day_start.strftime('%Y%m%d'))
+
+        symbols = _read_symbols(self._day_path + '.symbols')
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(symbols)}
+        self._new_symbols = []
+
+        self._file = open(self._day_path + '.ticks', 'ab')
+        if self._file.tell() == 0:
+            header = LOG_MAGIC + bytes([LOG_VERSION]) + struct.pack('<I', RECORD_DTYPE.itemsize)
+            self._file.write(header.ljust(LOG_HEADER_SIZE, b'\0'))
+
+
+class StreamReplay:
+    """
+    Replays the logs written by StreamRecorder. Iterating yields the same one row DataFrames as
+    ActiveTick.quoteStream, ticks and batches match parse_tick and quoteStreamBatches
+
+    # Example
+    for df in StreamReplay('/data/ticks', symbols=('SPY',), begin=datetime(2016, 9, 28), speed=10):
+        print(df)
+    """
+    def __init__(self, root, symbols=None, begin=None, end=None, speed=None, block_size=65536):
+        """
+        :param root:
+        directory of the logs
+        :param symbols:
+        iter of symbols to replay, None for all
+        :param begin:
+        datetime, first tick replayed, None from the first log
+        :param end:
+        datetime, ticks at or after it are not replayed, None up to the last log
+        :param speed:
+        float, replay that many times faster than recorded, None for as fast as possible
+        :param block_size:
+        integer, records decoded at a time
+        """
+        self.root = root
+        self.symbols = None if symbols is None else frozenset([symbols] if isinstance(symbols, str) else symbols)
+        self.begin = begin
+        self.end = end
+        self.speed = speed
+        self.block_size = block_size
+
+    def __iter__(self):
+        return map(parse_stream_tick, self.lines())
+
+    def ticks(self):
+        """
+        :return:
+        generator of QuoteTick and TradeTick
+        """
+        return map(parse_tick, self.lines())
+
+    def batches(self, batch_size=5000, batch_interval=0.25):
+        """
+        :return:
+        generator of (quotes, trades) tuples of pandas.DataFrame, see ActiveTick.quoteStreamBatches
+        """
+        return map(parse_stream_batch, _batch_lines(self.lines(), batch_size, batch_interval))
+
+    def lines(self):
+        """
+        :return:
+        generator of quoteStream lines (bytes) in recorded order
+        """
+        started = None
+        for records, symbols in self._days():
+            for lo in range(0, len(records), self.block_size):
+                block = records[lo:lo + self.block_size]
+                if self.speed is None:
+                    for line in _format_lines(block, symbols):
+                        yield line
+                    continue
+
+                # Paced on the recorded timestamps, relative to the first tick replayed
+                for line, ns in zip(_format_lines(block, symbols), block['datetime'].tolist()):
+                    if started is None:
+                        started = (monotonic(), ns)
+                    delay = started[0] + (ns - started[1]) / 1e9 / self.speed - monotonic()
+                    if delay > 0:
+                        sleep(delay)
+                    yield line
+
+    def _days(self):
+        # (records, symbols) of every log in the replayed range, records memory mapped and filtered
+        days = sorted(name[:-len('.ticks')] for name in os.listdir(self.root) if name.endswith('.ticks'))
+        for day in days:
+            day_start = datetime.strptime(day, '%Y%m%d')
+            if (self.begin is not None and day_start + timedelta(days=1) <= self.begin) or \
+                    (self.end is not None and day_start >= self.end):
+                continue
+
+            path = os.path.join(self.root, day)
+            records = _map_log(path + '.ticks')
+            symbols = _read_symbols(path + '.symbols')
+            if self.begin is not None or self.end is not None:
+                times = records['datetime']
+                lo = 0 if self.begin is None else np.searchsorted(times, (self.begin - _EPOCH) // _MICROSECOND * 1000)
+                hi = len(times) if self.end is None else \
+                    np.searchsorted(times, (self.end - _EPOCH) // _MICROSECOND * 1000)
+                records = records[lo:hi]
+            if self.symbols is not None:
+                wanted = np.array([symbol in self.symbols for symbol in symbols] + [False], dtype=bool)
+                records = records[wanted[np.minimum(records['symbol'], len(symbols))]]
+            yield records, symbols
+
+
+def _map_log(path):
+    # Records of a log, memory mapped read-only
+    with open(path, 'rb') as f:
+        header = f.read(LOG_HEADER_SIZE)
+    if header[:len(LOG_MAGIC)] != LOG_MAGIC:
+        raise ValueError('{path} is not a quoteStream log'.format(path=path))
+    version = header[len(LOG_MAGIC)]
+    record_size = struct.unpack('<I', header[len(LOG_MAGIC) + 1:len(LOG_MAGIC) + 5])[0]
+    if version > LOG_VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError('{path} was written by a newer version, log version {version}'.format(
+            path=path, version=version))
+
+    count = (os.path.getsize(path) - LOG_HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if not count:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=LOG_HEADER_SIZE, shape=(count,))
+
+
+def _read_symbols(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def _stream_datetimes(ns):
+    # Nanoseconds since the epoch as the stream's YYYYmmddHHMMSSfff strings
+    ms = ns // 1000000
+    days = (ms // 86400000).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    seconds, millis = np.divmod(ms % 86400000, 1000)
+    clock = (seconds // 3600 * 10000 + seconds // 60 % 60 * 100 + seconds % 60) * 1000 + millis
+    return ((years * 10000 + month * 100 + day) * 1000000000 + clock).astype(str).tolist()
+
+
+def _format_lines(records, symbols):
+    # quoteStream lines of a block of records, the float columns are printed at float32 precision
+    names = [symbol.encode('utf-8') for symbol in symbols]
+    stamps = _stream_datetimes(records['datetime'])
+    bids = records['bid'].astype(str).tolist()
+    asks = records['ask'].astype(str).tolist()
+    lines = []
+    for i, (tag, symbol, bidz, askz, bid_ex, ask_ex, flags, cond) in enumerate(zip(
+            records['type'].tolist(), records['symbol'].tolist(), records['bidz'].tolist(),
+            records['askz'].tolist(), records['bid_ex'].tolist(), records['ask_ex'].tolist(),
+            records['flags'].tolist(), records['cond'].view(np.int8).tolist())):
+        if tag == b'Q':
+            line = b'Q,%s,%d,%s,%s,%s,%s,%d,%d,%s' % (names[symbol], cond[0] & 0xFF, bid_ex, ask_ex, bids[i].encode(),
+                                                     asks[i].encode(), bidz, askz, stamps[i].encode())
+        else:
+            line = b'T,%s,%s,%d,%d,%d,%d,%s,%s,%d,%s' % (names[symbol], flags, cond[0], cond[1], cond[2], cond[3],
+                                                         bid_ex, bids[i].encode(), bidz, stamps[i].encode())
+        lines.append(line)
+    return lines
@@ -0,0 +1,159 @@
+from . parsers import STREAM_QUOTE_NAMES, STREAM_QUOTE_DTYPES, STREAM_TRADE_NAMES, STREAM_TRADE_DTYPES, parse_tick
+import numpy as np
+import pandas as pd
+"""
+NumPy output without pandas objects
+
+Parsed data as numpy structured arrays or dicts of typed column arrays, with the field names and dtypes of the
+DataFrames. Text columns become fixed width bytes, prices can be stored as fixed-point integers.
+
+These functions are for
+activetick.py : quoteStream, barData, tickData (output='records' or 'columns')
+"""
+
+FRAME = 'frame'
+RECORDS = 'records'
+COLUMNS = 'columns'
+
+# Columns holding prices, scaled to integers when a number of decimals is given
+PRICE_COLUMNS = frozenset(['bid', 'ask', 'last', 'open', 'high', 'low', 'close'])
+
+# Fixed-point value of missing prices, in the rows of the other tick type of mixed tickData
+MISSING_PRICE = np.iinfo(np.int64).min
+
+# Bytes of the text fields of single stream records, every other text field is one character
+STREAM_WIDTHS = {'symbol': 32, 'flags': 4}
+
+_stream_dtypes = {}
+
+
+def convert(df, output=FRAME, decimals=None):
+    """
+    :param df:
+    pandas.DataFrame or tuple of them
+    :param output:
+    'frame' to return df unchanged, 'records' for to_records or 'columns' for to_columns
+    :return:
+    df in the output format, tuples converted item by item
+    """
+    if output == FRAME:
+        return df
+    if output not in (RECORDS, COLUMNS):
+        raise ValueError('output must be one of {outputs}'.format(outputs=(FRAME, RECORDS, COLUMNS)))
+    if isinstance(df, tuple):
+        return tuple(convert(frame, output, decimals) for frame in df)
+    return to_records(df, decimals) if output == RECORDS else to_columns(df, decimals)
+
+
+def to_columns(df, decimals=None):
+    """
+    :param df:
+    pandas.DataFrame as returned by the parsers, a named index becomes the first column
+    :param decimals:
+    integer, store prices as int64 counts of 10 ** -decimals (MISSING_PRICE where NaN), None to keep them as floats
+    :return:
+    dict of column name to numpy array, numeric columns share memory with df where possible
+    """
+    if df.index.name is not None:
+        df = df.reset_index()
+    columns = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if values.dtype == object:
+            # Missing text (NaN in the rows of the other tick type) becomes b''
+            values = df[name].fillna('').to_numpy().astype('S')
+        elif decimals is not None and name in PRICE_COLUMNS:
+            values = _fixed_point(values, decimals)
+        columns[name] = values
+    return columns
+
+
+def to_records(df, decimals=None):
+    """
+    :return:
+    numpy structured array with one field per column, see to_columns
+    """
+    columns = to_columns(df, decimals)
+    records = np.empty(len(df), dtype=[(name, values.dtype) for name, values in columns.items()])
+    for name, values in columns.items():
+        records[name] = values
+    return records
+
+
+def to_frame(data, index=None, decimals=None):
+    """
+    Turns records or columns back into the DataFrame they were made from
+    :param data:
+    numpy structured array or dict of column arrays
+    :param index:
+    name of the column to index on, None for a default index
+    :param decimals:
+    integer, the decimals prices were stored with, they are turned back into float32
+    :return:
+    pandas.DataFrame, text columns as str
+    """
+    names = data.dtype.names if isinstance(data, np.ndarray) else list(data)
+    columns = {}
+    for name in names:
+        values = data[name]
+        if values.dtype.kind == 'S':
+            values = values.astype(str).astype(object)
+        elif decimals is not None and name in PRICE_COLUMNS:
+            values = np.where(values == MISSING_PRICE, np.nan, values / 10 ** decimals).astype(np.float32)
+        columns[name] = values
+    df = pd.DataFrame(columns)
+    return df.set_index(index) if index is not None else df
+
+
+def stream_record(line, decimals=None):
+    """
+    Parses a single quoteStream line into a numpy record, much cheaper than a one row DataFrame
+    :param line:
+    bytes, one line of the stream
+    :param decimals:
+    integer, store prices as int64 counts of 10 ** -decimals, None for float32
+    :return:
+    numpy.void with the quoteStream field names, see stream_dtype
+    """
+    tick = parse_tick(line)
+    dtype = stream_dtype(tick.type, decimals)
+    if decimals is not None:
+        scale = 10 ** decimals
+        tick = tick._replace(**{name: round(getattr(tick, name) * scale) for name in tick._fields
+                                if name in PRICE_COLUMNS})
+    return np.array(tuple(tick), dtype=dtype)[()]
+
+
+def stream_dtype(tag, decimals=None):
+    """
+    :param tag:
+    'Q' or 'T'
+    :return:
+    numpy structured dtype of the stream records of that tick type
+    """
+    key = (tag, decimals)
+    dtype = _stream_dtypes.get(key)
+    if dtype is None:
+        names, dtypes = (STREAM_QUOTE_NAMES, STREAM_QUOTE_DTYPES) if tag == 'Q' else \
+            (STREAM_TRADE_NAMES, STREAM_TRADE_DTYPES)
+        fields = []
+        for name in names:
+            if name == 'datetime':
+                fields.append((name, 'datetime64[ns]'))
+            elif dtypes[name] is object:
+                fields.append((name, 'S{width}'.format(width=STREAM_WIDTHS.get(name, 1))))
+            elif decimals is not None and name in PRICE_COLUMNS:
+                fields.append((name, np.int64))
+            else:
+                fields.append((name, dtypes[name]))
+        dtype = _stream_dtypes[key] = np.dtype(fields)
+    return dtype
+
+
+def _fixed_point(values, decimals):
+    # Prices rounded to int64 counts of 10 ** -decimals, float32 prices are exact to about 7 significant digits
+    values = values.astype(np.float64)
+    missing = np.isnan(values)
+    fixed = np.round(np.where(missing, 0, values) * 10 ** decimals).astype(np.int64)
+    fixed[missing] = MISSING_PRICE
+    return fixed
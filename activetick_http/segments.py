@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+"""
+Time range arithmetic for the segment cache
+
+Cached history is stored in fixed segments, one trading day for intraday bars and ticks and one
+year for daily and weekly bars, next to the list of [begin, end) ranges already fetched.
+
+These functions are for
+activetick.py : barData, tickData
+"""
+
+DAY = 'day'
+YEAR = 'year'
+
+# Timezone of the proxy timestamps
+EXCHANGE_TIMEZONE = 'America/New_York'
+
+
+def exchange_now():
+    """
+    Current time in EXCHANGE_TIMEZONE as a naive datetime, comparable with proxy timestamps. Local time when
+    the timezone database is not available, pass ActiveTick a clock then
+    """
+    try:
+        return datetime.now(ZoneInfo(EXCHANGE_TIMEZONE)).replace(tzinfo=None)
+    except Exception:
+        return datetime.now()
+
+
+def segment_bounds(t, segment):
+    """
+    Segment containing a datetime
+    :param t:
+    datetime
+    :param segment:
+    DAY or YEAR
+    :return:
+    (segment_id, start, stop) the segment id string and its [start, stop) datetimes
+    """
+    if segment == DAY:
+        start = datetime(t.year, t.month, t.day)
+        return start.strftime('%Y%m%d'), start, start + timedelta(days=1)
+    start = datetime(t.year, 1, 1)
+    return start.strftime('%Y'), start, datetime(t.year + 1, 1, 1)
+
+
+def segments_between(begin, end, segment):
+    """
+    All segments intersecting the range [begin, end)
+    :return:
+    list of (segment_id, start, stop)
+    """
+    segments = []
+    t = begin
+    while t < end:
+        bounds = segment_bounds(t, segment)
+        segments.append(bounds)
+        t = bounds[2]
+    return segments
+
+
+def align_to_segments(begin, end, segment):
+    """
+    Widens the range [begin, end) to whole segments
+    """
+    return segment_bounds(begin, segment)[1], segments_between(begin, end, segment)[-1][2]
+
+
+def merge_ranges(ranges):
+    """
+    Sorts [begin, end) ranges and merges the overlapping or touching ones
+    :return:
+    list of (begin, end)
+    """
+    merged = []
+    for begin, end in sorted(ranges):
+        if merged and begin <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((begin, end))
+    return merged
+
+
+def missing_ranges(covered, begin, end):
+    """
+    Parts of [begin, end) not inside any of the covered ranges
+    :param covered:
+    list of (begin, end), as returned by merge_ranges
+    :return:
+    list of (begin, end) in time order
+    """
+    missing = []
+    t = begin
+    for covered_begin, covered_end in covered:
+        if covered_end <= t:
+            continue
+        if covered_begin >= end:
+            break
+        if covered_begin > t:
+            missing.append((t, covered_begin))
+        t = max(t, covered_end)
+    if t < end:
+        missing.append((t, end))
+    return missing
+
+
+def remove_range(ranges, begin, end):
+    """
+    Takes [begin, end) out of a list of ranges
+    :param ranges:
+    list of (begin, end)
+    :return:
+    list of (begin, end), the ranges or parts of them outside [begin, end)
+    """
+    return [part for r in ranges for part in missing_ranges([(begin, end)], *r)]
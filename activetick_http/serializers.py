@@ -0,0 +1,163 @@
+import pickle
+import zlib
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+"""
+Serializers for the DataFrames kept in the cache backend
+
+Every blob starts with a header naming its format and format version, so formats can change without flushing the
+cache. Only safe formats are read back by default: a pickle in a shared cache runs code when it is loaded, so pickled
+entries are read only by clients configured with PickleSerializer.
+
+These classes are for
+activetick.py : ActiveTick(serializer=...)
+"""
+
+MAGIC = b'ATF'
+
+# format id: serializer class, filled by register
+SERIALIZERS = {}
+
+
+def register(serializer):
+    """
+    Makes blobs of a Serializer subclass readable by loads
+    """
+    SERIALIZERS[serializer.format_id] = serializer
+    return serializer
+
+
+class Serializer:
+    """
+    Base class, subclasses set a unique format_id, their current version and implement _dumps and _loads.
+    safe is False for formats that can run code when read
+    """
+    format_id = None
+    version = 1
+    safe = True
+
+    def dumps(self, df):
+        """
+        :return:
+        bytes, header followed by the serialized frame
+        """
+        return MAGIC + bytes([self.format_id, self.version]) + self._dumps(df)
+
+    def loads(self, blob):
+        """
+        Reads a blob of this format or of any safe one
+        """
+        return loads(blob, safe_formats() + [self.format_id])
+
+    def _dumps(self, df):
+        raise NotImplementedError
+
+    @classmethod
+    def _loads(cls, payload, version):
+        raise NotImplementedError
+
+
+@register
+class ArrowSerializer(Serializer):
+    """
+    Columnar Arrow IPC stream. Uncompressed numeric columns are read without copying the blob,
+    compressed ones are decompressed straight into Arrow buffers
+    """
+    format_id = 1
+
+    def __init__(self, compression='lz4'):
+        """
+        :param compression:
+        'lz4', 'zstd' or None
+        """
+        if pa is None:
+            raise ImportError('ArrowSerializer requires pyarrow, install with pip install activetick_http[arrow]')
+        self.compression = compression
+        self._options = pa.ipc.IpcWriteOptions(compression=compression)
+
+    def _dumps(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema, options=self._options) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @classmethod
+    def _loads(cls, payload, version):
+        if pa is None:
+            raise ImportError('Reading Arrow cache entries requires pyarrow')
+        return pa.ipc.open_stream(pa.py_buffer(payload)).read_all().to_pandas(split_blocks=True)
+
+
+@register
+class PickleSerializer(Serializer):
+    """
+    zlib compressed pickle. Reading a pickle can run any code and DataFrame pickles may not load in another pandas
+    version, only use it for a cache that only trusted clients with the same pandas write to
+    """
+    format_id = 2
+    safe = False
+
+    def __init__(self, level=1):
+        """
+        :param level:
+        zlib compression level, 0 to 9
+        """
+        self.level = level
+
+    def _dumps(self, df):
+        return zlib.compress(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), self.level)
+
+    @classmethod
+    def _loads(cls, payload, version):
+        return pickle.loads(zlib.decompress(payload))
+
+
+def default_serializer():
+    """
+    ArrowSerializer with lz4 when pyarrow is installed, None otherwise
+    """
+    if pa is not None:
+        return ArrowSerializer()
+    return None
+
+
+def safe_formats():
+    """
+    :return:
+    list of the format ids of the registered serializers that cannot run code when read
+    """
+    return [format_id for format_id, serializer in SERIALIZERS.items() if serializer.safe]
+
+
+def loads(blob, formats=None):
+    """
+    Reads a blob written by a registered serializer
+    :param formats:
+    iter of the format ids accepted, None for the safe formats, blobs of other formats raise ValueError
+    :return:
+    pandas.DataFrame
+    """
+    blob = memoryview(blob)
+    if bytes(blob[:len(MAGIC)]) != MAGIC:
+        # Written by to_msgpack before serializers were versioned
+        if hasattr(pd, 'read_msgpack'):
+            return pd.read_msgpack(bytes(blob))
+        raise ValueError('Cache entry predates versioned serializers and needs pandas < 1.0 to read, '
+                         'flush the cache')
+
+    format_id, version = blob[len(MAGIC)], blob[len(MAGIC) + 1]
+    serializer = SERIALIZERS.get(format_id)
+    if serializer is None:
+        raise ValueError('Unknown cache entry format {format_id}'.format(format_id=format_id))
+    if format_id not in (safe_formats() if formats is None else formats):
+        raise ValueError('Cache entry format {name} is not accepted, configure the client with it to read it'.format(
+            name=serializer.__name__))
+    if version > serializer.version:
+        raise ValueError('Cache entry format {name} version {version} is newer than this release reads'.format(
+            name=serializer.__name__, version=version))
+    return serializer._loads(blob[len(MAGIC) + 2:], version)
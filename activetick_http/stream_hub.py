@@ -0,0 +1,314 @@
+from . parsers import parse_tick
+from collections import deque, OrderedDict
+from threading import Thread, Condition, Event, RLock
+"""
+Shared quoteStream fan-out
+
+One StreamHub keeps as few upstream quoteStream connections as possible for the union of the symbols
+its subscribers want, and hands every tick to the bounded queue of each interested subscriber.
+"""
+
+DROP = 'drop'
+CONFLATE = 'conflate'
+BLOCK = 'block'
+
+# Seconds before reconnecting a stream the proxy ended, doubled for every stream in a row ending without a tick
+RECONNECT_DELAY = 1
+RECONNECT_DELAY_MAX = 60
+
+
+class Subscription:
+    """
+    Bounded queue of ticks for one consumer, created with StreamHub.subscribe. When the queue is full the
+    policy decides what happens to new ticks:
+    drop - the new tick is discarded and counted in dropped
+    conflate - only the latest tick per (type, symbol) is kept, the queue never holds more than that
+    block - the upstream connection waits for the consumer, slowing every subscriber sharing it
+When the hub gives up reconnecting the subscription is closed and error holds the last exception
+
+    # Example
+    for tick in subscription:
+        print(tick.symbol, tick.datetime)
+    """
+    def __init__(self, hub, maxsize, policy):
+        if policy not in (DROP, CONFLATE, BLOCK):
+            raise ValueError('policy must be one of {policies}'.format(policies=(DROP, CONFLATE, BLOCK)))
+        self.hub = hub
+        self.maxsize = maxsize
+        self.policy = policy
+        self.symbols = frozenset()
+        self.dropped = 0
+        self.closed = False
+        self.error = None
+
+        self._ready = Condition()
+        self._queue = OrderedDict() if policy == CONFLATE else deque()
+
+    def add(self, symbols):
+        """
+        Starts receiving ticks for more symbols, without reconnecting the symbols already streamed
+        """
+        self.hub._update(self, self.symbols | _symbol_set(symbols))
+
+    def remove(self, symbols):
+        """
+        Stops receiving ticks for symbols
+        """
+        self.hub._update(self, self.symbols - _symbol_set(symbols))
+
+    def close(self):
+        """
+        Unsubscribes, ticks already queued can still be read
+        """
+        self.hub._update(self, frozenset())
+        self._close()
+
+    def get(self, timeout=None):
+        """
+        Next tick, waiting for one if the queue is empty
+        :param timeout:
+        seconds to wait, None to wait until a tick arrives or the subscription is closed
+        :return:
+        QuoteTick or TradeTick, None on timeout or once closed and drained
+        """
+        with self._ready:
+            self._ready.wait_for(lambda: self._queue or self.closed, timeout)
+            if not self._queue:
+                return None
+            if self.policy == CONFLATE:
+                tick = self._queue.popitem(last=False)[1]
+            else:
+                tick = self._queue.popleft()
+            self._ready.notify_all()
+            return tick
+
+    def __iter__(self):
+        while True:
+            tick = self.get()
+            if tick is None:
+                return
+            yield tick
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _put(self, tick):
+        with self._ready:
+            if self.policy == CONFLATE:
+                self._queue[(tick.type, tick.symbol)] = tick
+            elif len(self._queue) < self.maxsize:
+                self._queue.append(tick)
+            elif self.policy == DROP:
+                self.dropped += 1
+                return
+            else:
+                while len(self._queue) >= self.maxsize and not self.closed:
+                    self._ready.wait()
+                self._queue.append(tick)
+            self._ready.notify_all()
+
+    def _close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class StreamHub:
+    """
+    Fans one set of upstream quoteStream connections out to many subscribers. Subscribing to new symbols
+    opens a connection for those symbols only, so the ticks of symbols already streamed are not interrupted.
+    When that would exceed max_connections every symbol is moved to a single new connection, opened before
+    the old ones are closed. Connections whose symbols are no longer wanted are closed, symbols removed from
+    a connection still in use are filtered out.
+
+    # Example
+    hub = StreamHub(at)
+    spy = hub.subscribe('SPY', policy='conflate')
+    both = hub.subscribe(('SPY', 'VXX'), maxsize=100000)
+    both.remove('SPY')
+    for tick in spy:
+        print(tick)
+    """
+    def __init__(self, at, max_connections=2, timeout=None, retries=10, reconnect_delay=RECONNECT_DELAY):
+        """
+        :param at:
+        ActiveTick instance the connections are opened with
+        :param max_connections:
+        integer, most upstream quoteStream connections kept open
+        :param timeout:
+        seconds passed to requests for the upstream connections
+        :param retries:
+        integer, reconnects in a row without a tick before the hub and its subscriptions are closed with the
+        error, None to keep reconnecting
+        :param reconnect_delay:
+        seconds before the first reconnect, doubled for every further one up to RECONNECT_DELAY_MAX
+        """
+        self.at = at
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.reconnect_delay = reconnect_delay
+        self.error = None
+
+        # Reconnects in a row without a tick, set when the hub is closed to stop the waiting ones
+        self._failures = 0
+        self._closed = Event()
+
+        self._lock = RLock()
+        self._subscriptions = {}
+        self._upstreams = []
+
+        # Replaced, never mutated, so the reader threads use them without locking
+        self._routes = {}
+        self._owner = {}
+
+    def subscribe(self, symbols, maxsize=10000, policy=DROP):
+        """
+        :param symbols:
+        string or iter of symbols
+        :param maxsize:
+        integer, ticks queued before the policy applies
+        :param policy:
+        'drop', 'conflate' or 'block' see Subscription
+        :return:
+        Subscription
+        """
+        subscription = Subscription(self, maxsize, policy)
+        self._update(subscription, _symbol_set(symbols))
+        return subscription
+
+    def close(self):
+        """
+        Closes every upstream connection and subscription
+        """
+        self._closed.set()
+        with self._lock:
+            for subscription in list(self._subscriptions):
+                subscription._close()
+            self._subscriptions = {}
+            self._routes = {}
+            self._owner = {}
+            for upstream in self._upstreams:
+                upstream.close()
+            self._upstreams = []
+
+    @property
+    def symbols(self):
+        return frozenset(self._routes)
+
+    def _update(self, subscription, symbols):
+        with self._lock:
+            if symbols:
+                self._subscriptions[subscription] = symbols
+            else:
+                self._subscriptions.pop(subscription, None)
+            subscription.symbols = symbols
+
+            routes = {}
+            for sub, sub_symbols in self._subscriptions.items():
+                for symbol in sub_symbols:
+                    routes.setdefault(symbol, []).append(sub)
+            self._routes = {symbol: tuple(subs) for symbol, subs in routes.items()}
+            self._reconcile()
+
+    def _reconcile(self):
+        # Opens and closes upstream connections so every wanted symbol is owned by exactly one of them
+        wanted = set(self._routes)
+        owner = {symbol: upstream for symbol, upstream in self._owner.items() if symbol in wanted}
+        missing = wanted - set(owner)
+
+        if missing:
+            if len(self._upstreams) < self.max_connections:
+                upstream = _Upstream(self, missing)
+            else:
+                upstream = _Upstream(self, wanted)
+            self._upstreams.append(upstream)
+            owner.update((symbol, upstream) for symbol in upstream.symbols)
+
+            # Owned before the reader starts so its first ticks are routed
+            self._owner = owner
+            upstream.start()
+
+        owning = set(owner.values())
+        for upstream in [upstream for upstream in self._upstreams if upstream not in owning]:
+            upstream.close()
+            self._upstreams.remove(upstream)
+        self._owner = owner
+
+    def _read(self, upstream):
+        error = None
+        try:
+            for line in upstream.lines:
+                tick = parse_tick(line)
+                self._failures = 0
+                if self._owner.get(tick.symbol) is upstream:
+                    for subscription in self._routes.get(tick.symbol, ()):
+                        subscription._put(tick)
+        except Exception as e:
+            error = e
+            if not upstream.closed:
+                self.error = e
+
+        if upstream.closed:
+            return
+        with self._lock:
+            if upstream not in self._upstreams:
+                return
+            self._upstreams.remove(upstream)
+            self._owner = {symbol: owner for symbol, owner in self._owner.items() if owner is not upstream}
+
+        # The proxy ended the stream, its symbols are reconnected with a growing delay
+        while True:
+            self._failures += 1
+            if self.retries is not None and self._failures > self.retries:
+                self._fail(error or ConnectionError('quoteStream ended {n} times in a row without a tick'.format(
+                    n=self._failures)))
+                return
+            delay = min(self.reconnect_delay * 2 ** (self._failures - 1), RECONNECT_DELAY_MAX)
+            if self._closed.wait(delay):
+                return
+            with self._lock:
+                if self._closed.is_set():
+                    return
+                try:
+                    self._reconcile()
+                    return
+                except Exception as e:
+                    error = self.error = e
+
+    def _fail(self, error):
+        # Gives up reconnecting, subscribers read the ticks already queued then see the subscription closed
+        self.error = error
+        with self._lock:
+            for subscription in self._subscriptions:
+                subscription.error = error
+        self.close()
+
+
+class _Upstream:
+    # One quoteStream connection and the thread reading it
+    def __init__(self, hub, symbols):
+        self.symbols = frozenset(symbols)
+        self.closed = False
+        self.response = hub.at.r.get(hub.at._quoteStreamUrl(sorted(self.symbols)), stream=True,
+                                     timeout=hub.timeout)
+        self.response.raise_for_status()
+
+        # First (acknowledgement) line is skipped like ActiveTick._open_stream
+        lines = filter(None, self.response.iter_lines())
+        first_line = next(lines, None)
+        self.lines = hub.at._measure_stream(lines)
+        self.thread = Thread(target=hub._read, args=(self,), daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.closed = True
+        self.response.close()
+
+
+def _symbol_set(symbols):
+    if isinstance(symbols, str):
+        symbols = symbols.split('+')
+    return frozenset(symbols)
@@ -0,0 +1,73 @@
+"""
+Benchmark of the serializers used for cached barData and tickData frames
+
+Compares encode time, decode time and blob size of the Arrow IPC and pickle serializers on a year of
+1 minute bars and a session of quotes and trades. msgpack is not measured, recent pandas no longer has it.
+usage: PYTHONPATH=. python benchmarks/bench_cache.py [bar_rows] [tick_rows]
+"""
+from activetick_http.parsers import TICK_QUOTE_NAMES, TICK_TRADE_NAMES
+from activetick_http.serializers import ArrowSerializer, PickleSerializer
+from timeit import repeat
+import numpy as np
+import pandas as pd
+import sys
+
+
+def bar_frame(rows):
+    # Random walk 1 minute bars, typed like parse_bar_data
+    close = (37 + np.cumsum(np.random.normal(0, 0.02, rows))).astype(np.float32)
+    index = pd.date_range('2016-01-04 09:30', periods=rows, freq='min', name='datetime')
+    return pd.DataFrame({
+        'open': close + np.float32(0.01),
+        'high': close + np.float32(0.03),
+        'low': close - np.float32(0.03),
+        'close': close,
+        'volume': np.random.randint(0, 50000, rows).astype(np.uint32)
+    }, index=index)
+
+
+def tick_frame(rows):
+    # Nine quotes for every trade, interleaved in time like parse_tick_data with trades and quotes
+    offsets = np.sort(np.random.randint(0, 6 * 3600 * 1000, rows)).astype('timedelta64[ms]')
+    index = pd.DatetimeIndex(np.datetime64('2016-09-28T09:30:00', 'ns') + offsets, name='datetime')
+    is_trade = np.random.rand(rows) < 0.1
+    mid = (216 + np.cumsum(np.random.normal(0, 0.005, rows))).astype(np.float32)
+    columns = {
+        'type': np.where(is_trade, 'T', 'Q'),
+        'last': np.where(is_trade, mid, np.nan).astype(np.float32),
+        'lastz': np.where(is_trade, np.random.randint(1, 1000, rows), np.nan),
+        'lastx': np.where(is_trade, 'Q', None),
+        'bid': np.where(is_trade, np.nan, mid - np.float32(0.01)).astype(np.float32),
+        'ask': np.where(is_trade, np.nan, mid + np.float32(0.01)).astype(np.float32),
+        'bidz': np.where(is_trade, np.nan, np.random.randint(1, 100, rows) * 100),
+        'askz': np.where(is_trade, np.nan, np.random.randint(1, 100, rows) * 100),
+        'bidx': np.where(is_trade, None, 'P'),
+        'askx': np.where(is_trade, None, 'Q'),
+    }
+    assert set(columns) <= set(TICK_QUOTE_NAMES + TICK_TRADE_NAMES)
+    return pd.DataFrame(columns, index=index)
+
+
+def main(bar_rows=98280, tick_rows=1000000):
+    frames = [('bars', bar_frame(bar_rows)), ('ticks', tick_frame(tick_rows))]
+    serializers = [
+        ('pickle zlib', PickleSerializer()),
+        ('arrow', ArrowSerializer(compression=None)),
+        ('arrow lz4', ArrowSerializer(compression='lz4')),
+        ('arrow zstd', ArrowSerializer(compression='zstd')),
+    ]
+
+    for frame_name, df in frames:
+        print('{name}: {rows} rows, {mb:.1f} MB in memory'.format(
+            name=frame_name, rows=len(df), mb=df.memory_usage(index=True, deep=True).sum() / 2 ** 20))
+        for name, serializer in serializers:
+            blob = serializer.dumps(df)
+            assert serializer.loads(blob).equals(df)
+            encode = min(repeat(lambda: serializer.dumps(df), number=1, repeat=3))
+            decode = min(repeat(lambda: serializer.loads(blob), number=1, repeat=3))
+            print('  {name:<12} encode {encode:8.2f} ms  decode {decode:8.2f} ms  {mb:8.2f} MB'.format(
+                name=name, encode=encode * 1000, decode=decode * 1000, mb=len(blob) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,41 @@
+"""
+Benchmark of the timestamp parsing used by tickData, barData and quoteStream
+
+Compares the vectorized parse_datetime against the per row strptime parser it replaced
+usage: PYTHONPATH=. python benchmarks/bench_dates.py [rows]
+"""
+from activetick_http.parsers import parse_datetime, TICK_DATE_FMT
+from datetime import datetime
+from timeit import repeat
+import numpy as np
+import sys
+
+
+def strptime_parser(dates, date_format=TICK_DATE_FMT):
+    # Previous ActiveTick._date_parser, one strptime call per row
+    return [datetime.strptime(date, date_format) for date in dates]
+
+
+def main(rows=100000):
+    # One trading session of millisecond timestamps
+    offsets = np.sort(np.random.randint(0, 6 * 3600 * 1000, rows)).astype(np.int64)
+    stamps = np.datetime64('2016-09-28T09:30:00', 'ms') + offsets.astype('timedelta64[ms]')
+    as_int = np.array([int(s.astype(datetime).strftime('%Y%m%d%H%M%S%f')[:-3]) for s in stamps], dtype=np.int64)
+    as_str = as_int.astype(str)
+
+    assert (parse_datetime(as_int) == np.array(strptime_parser(as_str), dtype='datetime64[ns]')).all()
+
+    results = [
+        ('strptime per row (str)', min(repeat(lambda: strptime_parser(as_str), number=1, repeat=3))),
+        ('parse_datetime (int64)', min(repeat(lambda: parse_datetime(as_int), number=1, repeat=3))),
+        ('parse_datetime (str)', min(repeat(lambda: parse_datetime(as_str), number=1, repeat=3))),
+    ]
+    baseline = results[0][1]
+    print('{rows} timestamps'.format(rows=rows))
+    for name, seconds in results:
+        print('{name:<26} {ms:10.2f} ms {speedup:8.1f}x'.format(name=name, ms=seconds * 1000,
+                                                                speedup=baseline / seconds))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
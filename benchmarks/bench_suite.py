@@ -0,0 +1,161 @@
+"""
+Offline benchmark suite, run against the local FakeProxy
+
+Measures per endpoint latency, rows parsed per second, quoteStream ticks per second, cache miss and hit cost and
+peak memory, and writes them as JSON so runs of different versions can be compared.
+usage: PYTHONPATH=. python benchmarks/bench_suite.py [--output results.json] [--repeat 5] [--fixtures DIR]
+"""
+from activetick_http import ActiveTick, MemoryCache, LocalStore, __version__
+from activetick_http.parsers import parse_bar_data, parse_tick_data
+from fake_proxy import FakeProxy
+from datetime import datetime, timedelta
+from statistics import median
+from time import perf_counter
+import argparse
+import json
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+import requests
+
+SESSION_BEGIN = datetime(2016, 9, 28, 9, 30)
+
+
+def timed(function, repeat):
+    # Median seconds of repeat calls and the result of the last one
+    seconds = []
+    for i in range(repeat):
+        start = perf_counter()
+        result = function()
+        seconds.append(perf_counter() - start)
+    return median(seconds), result
+
+
+def bench_endpoints(at, repeat):
+    symbols = ['SYM{i}'.format(i=i) for i in range(500)]
+    calls = {
+        'quoteData': lambda: at.quoteData(symbols, ['LastPrice', 'BidSize', 'AskSize'], meta=False),
+        'barData': lambda: at.barData('INTC', intradayMinutes=1, beginTime=datetime(2016, 9, 1),
+                                      endTime=datetime(2016, 9, 30, 16)),
+        'tickData': lambda: at.tickData('SPY', trades=True, quotes=True, beginTime=SESSION_BEGIN,
+                                        endTime=SESSION_BEGIN + timedelta(minutes=10)),
+        'optionChain': lambda: at.optionChain('SPY')
+    }
+    results = {}
+    for name, call in calls.items():
+        seconds, df = timed(call, repeat)
+        results[name] = {'latency_ms': seconds * 1000, 'rows': len(df)}
+    return results
+
+
+def bench_parsers(proxy, repeat):
+    # Parsing alone, on response bodies fetched once
+    base = 'http://{host}:{port}'.format(host=proxy.host, port=proxy.port)
+    bodies = {
+        'barData': (requests.get(base + '/barData?symbol=INTC&historyType=0&intradayMinutes=1'
+                                 '&beginTime=20160101000000&endTime=20161231235959').content, parse_bar_data),
+        'tickData quotes': (requests.get(base + '/tickData?symbol=SPY&trades=0&quotes=1'
+                                         '&beginTime=20160928093000&endTime=20160928160000').content,
+                            lambda body: parse_tick_data(body, False, True)),
+        'tickData mixed': (requests.get(base + '/tickData?symbol=SPY&trades=1&quotes=1'
+                                        '&beginTime=20160928093000&endTime=20160928160000').content,
+                           lambda body: parse_tick_data(body, True, True))
+    }
+    results = {}
+    for name, (body, parser) in bodies.items():
+        seconds, df = timed(lambda: parser(body), repeat)
+        results[name] = {'rows': len(df), 'seconds': seconds, 'rows_per_s': len(df) / seconds}
+    return results
+
+
+def bench_stream(at, proxy, repeat):
+    symbols = ['SYM{i}'.format(i=i) for i in range(50)]
+    results = {}
+    for name, stream in (('quoteStreamBatches', lambda: at.quoteStreamBatches(symbols)),
+                         ('quoteStream', lambda: at.quoteStream(symbols))):
+        # One row frames are slow, measured over fewer ticks
+        proxy.stream_ticks = 200000 if name == 'quoteStreamBatches' else 2000
+        if name == 'quoteStreamBatches':
+            seconds, ticks = timed(lambda: sum(len(quotes) + len(trades) for quotes, trades in stream()), repeat)
+        else:
+            seconds, ticks = timed(lambda: sum(1 for df in stream()), 1)
+        results[name] = {'ticks': ticks, 'ticks_per_s': ticks / seconds}
+    return results
+
+
+def bench_cache(port, repeat):
+    # First call fetches from the proxy and stores, the following ones are answered from the cache
+    def tick_data(at):
+        return at.tickData('SPY', trades=True, quotes=True, beginTime=SESSION_BEGIN,
+                           endTime=SESSION_BEGIN + timedelta(minutes=10))
+
+    # The fake proxy generates each response once, cached requests use their own URLs
+    tick_data(ActiveTick(port=port, memory_cache=MemoryCache()))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        backends = {
+            'none': lambda: ActiveTick(port=port),
+            'MemoryCache': lambda: ActiveTick(port=port, memory_cache=MemoryCache()),
+            'LocalStore': lambda: ActiveTick(port=port, cache=LocalStore(root + '/store')),
+            'LocalStore+MemoryCache': lambda: ActiveTick(port=port, cache=LocalStore(root + '/both'),
+                                                         memory_cache=MemoryCache())
+        }
+        for name, backend in backends.items():
+            at = backend()
+            miss, df = timed(lambda: tick_data(at), 1)
+            hit, df = timed(lambda: tick_data(at), repeat)
+            results[name] = {'rows': len(df), 'miss_ms': miss * 1000, 'hit_ms': hit * 1000}
+    return results
+
+
+def bench_memory(at):
+    # Peak memory allocated through Python and numpy while building a large tickData frame
+    tracemalloc.start()
+    df = at.tickData('SPY', trades=True, quotes=True, beginTime=SESSION_BEGIN,
+                     endTime=SESSION_BEGIN + timedelta(minutes=60))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result_bytes = int(df.memory_usage(index=True, deep=True).sum())
+    return {'tickData': {'rows': len(df), 'result_mb': result_bytes / 2 ** 20, 'peak_mb': peak / 2 ** 20,
+                         'peak_over_result': peak / result_bytes}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='file the JSON results are written to, stdout by default')
+    parser.add_argument('--repeat', type=int, default=5, help='calls per measurement, the median is kept')
+    parser.add_argument('--fixtures', help='directory of recorded responses served by the fake proxy')
+    args = parser.parse_args()
+
+    proxy = FakeProxy(fixtures=args.fixtures).start()
+    at = ActiveTick(port=proxy.port)
+    try:
+        results = {
+            'version': __version__,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'time': datetime.now().isoformat(),
+            'endpoints': bench_endpoints(at, args.repeat),
+            'parsers': bench_parsers(proxy, args.repeat),
+            'stream': bench_stream(at, proxy, args.repeat),
+            'cache': bench_cache(proxy.port, args.repeat),
+            'memory': bench_memory(at)
+        }
+    finally:
+        proxy.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Local stand-in for the ActiveTick HTTP proxy
+
+Serves /quoteData, /barData, /tickData, /optionChain and a chunked /quoteStream in the proxy's CSV formats.
+Responses are synthetic and deterministic, or read from recorded responses when a fixtures directory is given:
+fixtures/barData/SYMBOL.csv and fixtures/tickData/SYMBOL.csv are filtered to the requested range.
+tickData responses are truncated at TICKDATA_ROW_LIMIT rows like the proxy.
+usage: PYTHONPATH=. python benchmarks/fake_proxy.py [port]
+"""
+from activetick_http import TICKDATA_ROW_LIMIT
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from threading import Thread
+import os
+import sys
+import time
+
+DATE_FMT = '%Y%m%d%H%M%S'
+
+
+class FakeProxy:
+    """
+    # Example
+    proxy = FakeProxy().start()
+    at = ActiveTick(port=proxy.port)
+    ...
+    proxy.stop()
+    """
+    def __init__(self, host='127.0.0.1', port=0, fixtures=None, tick_interval=timedelta(milliseconds=10),
+                 stream_ticks=100000, stream_delay=0):
+        """
+        :param port:
+        integer, 0 for any free port
+        :param fixtures:
+        directory of recorded responses, None for synthetic data only
+        :param tick_interval:
+        timedelta between synthetic quotes, every third quote is followed by a trade
+        :param stream_ticks:
+        integer, ticks sent by /quoteStream before it ends
+        :param stream_delay:
+        seconds slept between streamed ticks
+        """
+        self.fixtures = fixtures
+        self.tick_interval = tick_interval
+        self.stream_ticks = stream_ticks
+        self.stream_delay = stream_delay
+        self.requests = 0
+
+        # Generated responses by request path, so repeated requests measure the client rather than this server
+        self._responses = {}
+
+        proxy = self
+
+        class Handler(_Handler):
+            pass
+        Handler.proxy = proxy
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+
+    def start(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def quote_data(self, query):
+        symbols = query['symbol'].replace(' ', '+').split('+')
+        fields = query['field'].replace(' ', '+').split('+')
+        values = ','.join('{field},1,7,{value}'.format(field=field, value=1.5) for field in fields)
+        return ''.join('{symbol},1,{values}\r\n'.format(symbol=symbol, values=values) for symbol in symbols)
+
+    def bar_data(self, query):
+        begin = datetime.strptime(query['beginTime'], DATE_FMT)
+        end = datetime.strptime(query['endTime'], DATE_FMT)
+        recorded = self._recorded('barData', query['symbol'], begin, end, 0)
+        if recorded is not None:
+            return ''.join(recorded)
+
+        # Regular session bars intradayMinutes wide, labelled with their start, or one bar per weekday
+        minutes = int(query.get('intradayMinutes', 0))
+        lines = []
+        day = datetime(begin.year, begin.month, begin.day)
+        while day <= end:
+            if day.weekday() < 5:
+                if minutes:
+                    step = timedelta(minutes=minutes)
+                    t, close = day + timedelta(hours=9, minutes=30) // step * step, day + timedelta(hours=16)
+                else:
+                    step = timedelta(days=1)
+                    t, close = day, day + step
+                while t < close:
+                    if begin <= t <= end:
+                        i = len(lines)
+                        price = 37 + i % 50 * 0.01
+                        lines.append('{t},{open:.2f},{high:.2f},{low:.2f},{close:.2f},{volume}\r\n'.format(
+                            t=t.strftime(DATE_FMT), open=price, high=price + 0.05, low=price - 0.05,
+                            close=price + 0.01, volume=1000 + i % 97 * 10))
+                    t += step
+            day += timedelta(days=1)
+        return ''.join(lines)
+
+    def tick_data(self, query):
+        begin = datetime.strptime(query['beginTime'], DATE_FMT)
+        end = datetime.strptime(query['endTime'], DATE_FMT)
+        trades, quotes = query['trades'] == '1', query['quotes'] == '1'
+        recorded = self._recorded('tickData', query['symbol'], begin, end, 1)
+        if recorded is not None:
+            tags = ('T' if trades else '') + ('Q' if quotes else '')
+            return ''.join([line for line in recorded if line[:1] in tags][:TICKDATA_ROW_LIMIT])
+
+        # endTime is inclusive, ticks of its whole second are returned
+        end += timedelta(seconds=1)
+        lines = []
+        t, i = begin, 0
+        while t < end and len(lines) < TICKDATA_ROW_LIMIT:
+            stamp = t.strftime('%Y%m%d%H%M%S%f')[:-3]
+            if quotes:
+                lines.append('Q,{t},{bid:.2f},{ask:.2f},{bidz},200,P,Q,0\r\n'.format(
+                    t=stamp, bid=100 + i % 7 * 0.01, ask=100.01 + i % 7 * 0.01, bidz=100 + i % 5))
+            if trades and i % 3 == 0:
+                lines.append('T,{t},{last:.2f},300,P,0,12,14,0\r\n'.format(t=stamp, last=100 + i % 7 * 0.01))
+            t += self.tick_interval
+            i += 1
+        return ''.join(lines[:TICKDATA_ROW_LIMIT])
+
+    def option_chain(self, query):
+        return ''.join('OPTION:{symbol}---1610{day:02d}{right}{strike:08d}\r\n'.format(
+            symbol=query['symbol'], day=14 + i % 3, right='CP'[i % 2], strike=186000 + i // 2 * 1000)
+            for i in range(200))
+
+    def stream_lines(self, query):
+        symbols = query['symbol'].replace(' ', '+').split('+')
+        start = datetime(2016, 9, 28, 9, 30)
+        for i in range(self.stream_ticks):
+            if self.stream_delay:
+                time.sleep(self.stream_delay)
+            symbol = symbols[i % len(symbols)]
+            stamp = (start + timedelta(milliseconds=i)).strftime('%Y%m%d%H%M%S%f')[:-3]
+            if i % 4 == 3:
+                yield 'T,{symbol},1,0,12,14,0,P,{last:.2f},{lastz},{t}\r\n'.format(
+                    symbol=symbol, last=100 + i % 9 * 0.01, lastz=100 + i % 7, t=stamp)
+            else:
+                yield 'Q,{symbol},0,P,Q,{bid:.2f},{ask:.2f},{bidz},200,{t}\r\n'.format(
+                    symbol=symbol, bid=100 + i % 9 * 0.01, ask=100.02 + i % 9 * 0.01, bidz=100 + i % 5, t=stamp)
+
+    def _recorded(self, endpoint, symbol, begin, end, datetime_field):
+        # Lines of a recorded response within [begin, end], None without a recording for the symbol
+        if self.fixtures is None:
+            return None
+        path = os.path.join(self.fixtures, endpoint, symbol + '.csv')
+        if not os.path.exists(path):
+            return None
+        lo, hi = begin.strftime(DATE_FMT), end.strftime(DATE_FMT)
+        with open(path) as f:
+            return [line for line in f if lo <= line.split(',')[datetime_field][:14] <= hi]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    proxy = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.proxy.requests += 1
+
+        if url.path == '/quoteStream':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self._chunk(b'ok\r\n')
+
+            # Without a delay lines are sent in larger chunks, so the client rather than the server is measured
+            pending = []
+            lines = self.proxy.stream_lines(query)
+            if not self.proxy.stream_delay:
+                key = (self.path, self.proxy.stream_ticks)
+                if key not in self.proxy._responses:
+                    self.proxy._responses[key] = list(lines)
+                lines = self.proxy._responses[key]
+            for line in lines:
+                pending.append(line)
+                if self.proxy.stream_delay or len(pending) >= 1000:
+                    self._chunk(''.join(pending).encode())
+                    pending = []
+            if pending:
+                self._chunk(''.join(pending).encode())
+            self._chunk(b'')
+            return
+
+        endpoints = {
+            '/quoteData': self.proxy.quote_data,
+            '/barData': self.proxy.bar_data,
+            '/tickData': self.proxy.tick_data,
+            '/optionChain': self.proxy.option_chain
+        }
+        if url.path not in endpoints:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = self.proxy._responses.get(self.path)
+        if body is None:
+            body = self.proxy._responses[self.path] = endpoints[url.path](query).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+
+if __name__ == '__main__':
+    proxy = FakeProxy(port=int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
+    print('Fake ActiveTick proxy on http://{host}:{port}'.format(host=proxy.host, port=proxy.port))
+    proxy.server.serve_forever()
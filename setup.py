@@ -25,20 +25,29 @@ setup(
                    'redis'
     ],
     package_dir={'activetick_http': 'activetick_http'},
+    python_requires='>=3.9',
     install_requires=[
-        'pandas',
+        'pandas>=2.0',
         'requests',
-        'numpy',
+        'numpy>=1.23',
         'redis'
     ],
+    entry_points={
+        'console_scripts': ['activetick-backfill=activetick_http.backfill:main']
+    },
+    extras_require={
+        'async': ['aiohttp'],
+        'arrow': ['pyarrow>=10']
+    },
     classifiers=[
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5'
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12'
     ]
 )
@@ -1,10 +1,73 @@
 from redis import StrictRedis
-from activetick_http import ActiveTick
-from datetime import datetime
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from activetick_http import ActiveTick, AsyncActiveTick, BarBuilder, LocalStore, QuoteTable, StreamHub, \
+    StreamRecorder, StreamReplay, TICKDATA_ROW_LIMIT
+from activetick_http.parsers import BAR_DATE_FMT, BAR_DTYPES, BAR_NAMES, parse_bar_data, parse_datetime, \
+    parse_quote_data, parse_stream_batch, parse_tick_data, parse_tick, split_ticks
+from activetick_http.backfill import Checkpoint, backfill, schedule_jobs
+from activetick_http.bars import _bar_start, resample_bars
+from activetick_http.memory_cache import MemoryCache
+from activetick_http.metrics import Metrics, measure_stream
+from activetick_http.records import MISSING_PRICE, stream_record, to_frame, to_records
+from activetick_http.serializers import ArrowSerializer, PickleSerializer, loads
+from activetick_http.stream_hub import Subscription
+from activetick_http.segments import DAY, exchange_now, merge_ranges, missing_ranges, segments_between
+from datetime import datetime, timedelta
 import numpy as np
+import pandas as pd
 
 from tabulate import tabulate
 
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        return iter(self.content.splitlines())
+
+    def close(self):
+        pass
+
+
+def fake_session(handler, response=FakeResponse):
+    """
+    Session stub answering every GET with the body (bytes) returned by handler(url), streamed line by line
+    to quoteStream
+    :param response:
+    class of the responses, built from the body
+    """
+    class Session:
+        def get(self, url, stream=False, timeout=None):
+            return response(handler(url))
+
+    return Session()
+
+
+def fake_tick_proxy(ticks, requests=None):
+    """
+    ActiveTick serving the ticks of the requested whole seconds, truncated at TICKDATA_ROW_LIMIT rows like the proxy
+    :param requests:
+    list the (beginTime, endTime) of every request is appended to
+    """
+    class FakeProxy(ActiveTick):
+        def _tickDataRequest(self, symbol, trades, quotes, beginTime_s, endTime_s):
+            if requests is not None:
+                requests.append((beginTime_s, endTime_s))
+            lo = datetime.strptime(beginTime_s, self._date_fmt)
+            hi = datetime.strptime(endTime_s, self._date_fmt) + timedelta(seconds=1)
+            return ticks[(ticks.index >= lo) & (ticks.index < hi)].iloc[:TICKDATA_ROW_LIMIT]
+
+    return FakeProxy
+
+
 at = ActiveTick(cache=StrictRedis(host='127.0.0.1'))
 class TestActiveTick():
     def test_quoteData(self):
@@ -53,5 +116,644 @@ class TestActiveTick():
 
     def test_optionChain(self):
         df = at.optionChain('SPY')
-        print('\noptionChain:\n', tabulate(df.head(), headers=[''], tablefmt='grid'))
+        print('\noptionChain:\n', tabulate(df.head(), headers='keys', tablefmt='grid'))
+        return True
+
+    def test_streamHub(self):
+        hub = StreamHub(at)
+        spy = hub.subscribe('SPY', policy='conflate')
+        both = hub.subscribe(('SPY', 'VXX'))
+        both.remove('SPY')
+        print('\nstreamHub:', spy.get(timeout=2), both.get(timeout=2))
+        hub.close()
+        return True
+
+    def test_asyncActiveTick(self):
+        async def __requests():
+            async with AsyncActiveTick() as async_at:
+                return await asyncio.gather(async_at.quoteData(['SPY', 'TLT'], ['LastPrice']),
+                                            async_at.barData('INTC', historyType='D', beginTime=datetime(2016, 9, 1)))
+        quotes, bars = asyncio.get_event_loop().run_until_complete(__requests())
+        print('\nasync quoteData:\n', tabulate(quotes, headers='keys', tablefmt='grid'))
         return True
+
+
+class TestParsers():
+    def test_parse_stream_batch(self):
+        lines = [b'Q,SPY,0,P,Q,216.46,216.55,100,200,20160928093000091',
+                 b'T,SPY,0,0,12,14,0,P,216.50,300,20160928093000182',
+                 b'Q,SPY,0,P,Q,216.47,216.55,100,300,20160928093000201']
+        quotes, trades = parse_stream_batch(lines)
+        assert len(quotes) == 2 and len(trades) == 1
+        assert quotes['bid'].dtype == np.float32
+        assert trades['lastz'].dtype == np.uint32
+        assert trades['datetime'].iloc[0] == datetime(2016, 9, 28, 9, 30, 0, 182000)
+
+        # Empty batches keep their typed columns
+        quotes, trades = parse_stream_batch([])
+        assert quotes.empty and quotes['bid'].dtype == np.float32
+
+    def test_batches_are_flushed_on_quiet_streams(self):
+        resumed = threading.Event()
+
+        class QuietResponse(FakeResponse):
+            def iter_lines(self):
+                # Two ticks, then nothing until the batch has been received
+                for line in self.content.splitlines():
+                    yield line
+                resumed.wait(5)
+
+        at_batches = ActiveTick()
+        at_batches.r = fake_session(lambda url: b'ok\nQ,SPY,0,P,Q,216.46,216.55,100,200,20160928093000091\n'
+                                                b'T,SPY,0,0,12,14,0,P,216.50,300,20160928093000182', QuietResponse)
+        start = time.monotonic()
+        quotes, trades = next(at_batches.quoteStreamBatches('SPY', batch_size=1000, batch_interval=0.05))
+        assert len(quotes) == 1 and len(trades) == 1 and time.monotonic() - start < 2
+        resumed.set()
+
+
+    def test_parse_datetime(self):
+        ticks = parse_datetime([20160928093000091, b'20161231235959999'])
+        assert ticks.dtype == np.dtype('datetime64[ns]')
+        assert list(ticks) == [np.datetime64('2016-09-28T09:30:00.091'), np.datetime64('2016-12-31T23:59:59.999')]
+        bars = parse_datetime(np.array(['20160928090000']), BAR_DATE_FMT)
+        assert bars[0] == np.datetime64(datetime(2016, 9, 28, 9))
+
+    def test_parse_tick_data_mixed(self):
+        content = (b'Q,20160928093000091,26.26,26.27,100,200,P,T,0\n'
+                   b'T,20160928093000091,26.27,52073,P,0,0,17,0\n'
+                   b'Q,20160928093000182,26.25,26.27,300,200,P,T,0\n')
+        df = parse_tick_data(content, trades=True, quotes=True)
+        assert list(df['type']) == ['Q', 'T', 'Q']
+        assert df.index.is_monotonic_increasing
+        assert df['last'].iloc[1] == np.float32(26.27) and np.isnan(df['last'].iloc[0])
+
+        trades, quotes = parse_tick_data(content, trades=True, quotes=True, split=True)
+        assert len(trades) == 1 and trades['lastz'].dtype == np.uint32
+        assert len(quotes) == 2 and quotes['bidz'].dtype == np.uint32
+
+
+class TestTickDataPagination():
+    def test_truncated_responses_are_split(self):
+        begin = datetime(2016, 9, 28, 9, 30)
+        index = pd.date_range(begin, periods=250000, freq='10ms', name='datetime')
+        ticks = pd.DataFrame({'bid': np.arange(len(index), dtype=np.float32)}, index=index)
+
+        df = fake_tick_proxy(ticks)().tickData('SPY', beginTime=begin, endTime=index[-1])
+        assert len(df) == len(ticks)
+        assert (df['bid'].values == ticks['bid'].values).all()
+
+    def test_bursts_at_a_window_end_keep_the_next_window(self):
+        # 100 ticks/s with a burst of 30k in the last second before the rate drops to 50 ticks/s
+        begin = datetime(2016, 9, 28, 9, 30)
+        offsets = np.sort(np.concatenate([np.arange(175000) * 10 ** 7, 1749 * 10 ** 9 + np.arange(30000) * 33000,
+                                          1750 * 10 ** 9 + np.arange(112500) * 2 * 10 ** 7]))
+        index = pd.DatetimeIndex(np.datetime64(begin, 'ns') + offsets.astype('timedelta64[ns]'), name='datetime')
+        ticks = pd.DataFrame({'bid': np.arange(len(index), dtype=np.float32)}, index=index)
+
+        FakeProxy = fake_tick_proxy(ticks)
+        for at in (FakeProxy(), FakeProxy(memory_cache=MemoryCache())):
+            df = at.tickData('SPY', beginTime=begin, endTime=index[-1])
+            assert len(df) == len(ticks)
+            assert (df['bid'].values == ticks['bid'].values).all()
+
+    def test_truncated_single_requests_are_cached_up_to_their_last_second(self):
+        begin = datetime(2016, 9, 28, 9, 30)
+        index = pd.date_range(begin, periods=250000, freq='10ms', name='datetime')
+        ticks = pd.DataFrame({'bid': np.arange(len(index), dtype=np.float32)}, index=index)
+
+        FakeProxy = fake_tick_proxy(ticks)
+        at = FakeProxy(memory_cache=MemoryCache())
+        assert len(at.tickData('SPY', beginTime=begin, endTime=index[-1], paginate=False)) == TICKDATA_ROW_LIMIT
+        assert len(at.tickData('SPY', beginTime=begin, endTime=index[-1])) == len(ticks)
+        tail = at.tickData('SPY', beginTime=index[-1000], endTime=index[-1], paginate=False)
+        assert len(tail) == 1000
+
+    def test_split_ticks_are_parsed_per_window(self):
+        begin = datetime(2016, 9, 28, 9, 30)
+        index = pd.date_range(begin, periods=150000, freq='10ms')
+        lines = [('T,{t},{i}.5,300,Q,0,17,0,0\r\n' if i % 3 == 0 else 'Q,{t},{i}.5,216.55,100,200,P,Q,0\r\n').format(
+            t=t[:-3], i=i) for i, t in enumerate(index.strftime('%Y%m%d%H%M%S%f'))]
+
+        class FakeProxy(ActiveTick):
+            def _get(self, url):
+                lo, hi = [datetime.strptime(t, self._date_fmt) for t in re.findall(r'Time=(\d+)', url)]
+                rows = lines[index.searchsorted(lo):index.searchsorted(hi + timedelta(seconds=1))]
+                return ''.join(rows[:TICKDATA_ROW_LIMIT]).encode()
+
+        at = FakeProxy()
+        trades, quotes = at.tickData('SPY', trades=True, quotes=True, beginTime=begin, endTime=index[-1], split=True)
+        merged = at.tickData('SPY', trades=True, quotes=True, beginTime=begin, endTime=index[-1])
+        expected_trades, expected_quotes = split_ticks(merged)
+        assert len(trades) == 50000 and len(quotes) == 100000
+        assert (trades['last'].values == np.arange(0, len(index), 3) + 0.5).all()
+        pd.testing.assert_frame_equal(trades, expected_trades)
+        pd.testing.assert_frame_equal(quotes, expected_quotes)
+
+    def test_chunks_continue_truncated_responses(self):
+        begin = datetime(2016, 9, 28, 9, 30)
+        index = pd.date_range(begin, periods=150000, freq='10ms')
+        lines = ['Q,{t},{bid}.5,216.55,100,200,P,Q,0\r\n'.format(t=t[:-3], bid=i)
+                 for i, t in enumerate(index.strftime('%Y%m%d%H%M%S%f'))]
+
+        class FakeProxy(ActiveTick):
+            # Streams the ticks in the requested whole seconds, truncated like the proxy
+            def _get_chunks(self, url):
+                lo, hi = [datetime.strptime(t, self._date_fmt) for t in re.findall(r'Time=(\d+)', url)]
+                rows = lines[index.searchsorted(lo):index.searchsorted(hi + timedelta(seconds=1))]
+                body = ''.join(rows[:TICKDATA_ROW_LIMIT]).encode()
+                for i in range(0, len(body), 65536):
+                    yield body[i:i + 65536]
+
+        chunks = list(FakeProxy().tickDataChunks('SPY', beginTime=begin, endTime=index[-1], chunk_size=40000))
+        df = pd.concat(chunks)
+        assert max(len(chunk) for chunk in chunks) <= 40000
+        assert (df['bid'].values == np.arange(len(index)) + 0.5).all() and df.index.is_monotonic_increasing
+
+
+class TestSegments():
+    def test_missing_ranges(self):
+        day = datetime(2016, 9, 28)
+        hour = timedelta(hours=1)
+        covered = merge_ranges([(day + 2 * hour, day + 3 * hour), (day, day + hour), (day + hour, day + 2 * hour)])
+        assert covered == [(day, day + 3 * hour)]
+        assert missing_ranges(covered, day + hour, day + 5 * hour) == [(day + 3 * hour, day + 5 * hour)]
+        assert missing_ranges(covered, day, day + 3 * hour) == []
+        assert [s[0] for s in segments_between(day + hour, day + timedelta(days=2), DAY)] == ['20160928', '20160929']
+
+
+    def test_unsettled_data_is_not_cached(self):
+        requests = []
+        index = pd.date_range(datetime(2016, 9, 28, 9, 30), datetime(2016, 9, 28, 16), freq='min', name='datetime')
+        ticks = pd.DataFrame({'bid': np.arange(len(index), dtype=np.float32)}, index=index)
+
+        at = fake_tick_proxy(ticks, requests)(memory_cache=MemoryCache(), clock=lambda: datetime(2016, 9, 28, 12, 1))
+        for i in range(2):
+            df = at.tickData('SPY', beginTime=datetime(2016, 9, 28, 9, 30), endTime=datetime(2016, 9, 28, 16))
+        assert len(df) == len(ticks) and [request[0] for request in requests] == ['20160928093000', '20160928120000']
+
+class TestMany():
+    def test_failures_are_reported_per_symbol(self):
+        class FakeProxy(ActiveTick):
+            def _barDataRequest(self, symbol, historyType, intradayMinutesAttr, beginTime_s, endTime_s):
+                if symbol == 'BAD':
+                    raise ValueError('no such symbol')
+                index = pd.DatetimeIndex([datetime(2016, 9, 28, 9)], name='datetime')
+                return pd.DataFrame({'close': np.float32([37.4])}, index=index)
+
+        data, errors = FakeProxy().barDataMany(['INTC', 'BAD', 'SPY'], as_frame=True)
+        assert list(errors) == ['BAD']
+        assert list(data.index.get_level_values('symbol')) == ['INTC', 'SPY']
+
+
+class TestQuoteData():
+    def test_symbol_chunks(self):
+        symbols = ['SYM{i}'.format(i=i) for i in range(1000)]
+        urls = at._quoteDataUrls(symbols, ['LastPrice', 'BidPrice'], max_url_length=500)
+        assert len(urls) > 1 and all(len(url) <= 500 for url in urls)
+        assert '+'.join(url.split('symbol=')[1].split('&')[0] for url in urls) == '+'.join(symbols)
+
+    def test_typed_lean_parse(self):
+        fields = ['LastPrice', 'BidSize']
+        content = b'SPY,1,5,1,7,216.3,25,1,7,100\nTLT,1,5,1,7,137.51,25,1,7,300\n'
+        df = parse_quote_data(content, *at._quoteDataColumns(fields, meta=False))
+        assert list(df.columns) == fields and list(df.index) == ['SPY', 'TLT']
+        assert df['LastPrice'].dtype == np.float32 and df['BidSize'].dtype == np.uint32
+
+
+class TestStreamHub():
+    def test_slow_consumer_policies(self):
+        ticks = [parse_tick(b'Q,SPY,0,P,Q,216.46,216.55,100,200,20160928093000091'),
+                 parse_tick(b'Q,VXX,0,P,Q,35.10,35.11,100,200,20160928093000092'),
+                 parse_tick(b'Q,SPY,0,P,Q,216.47,216.55,100,200,20160928093000093')]
+
+        dropping = Subscription(None, maxsize=2, policy='drop')
+        conflating = Subscription(None, maxsize=2, policy='conflate')
+        for tick in ticks:
+            dropping._put(tick)
+            conflating._put(tick)
+
+        assert dropping.dropped == 1 and dropping.get().bid == ticks[0].bid
+        assert len(conflating) == 2
+        assert conflating.get().bid == ticks[2].bid and conflating.get().symbol == 'VXX'
+        assert conflating.get(timeout=0) is None
+
+
+    def test_ended_streams_reconnect_with_backoff_then_close(self):
+        connected = []
+
+        def connect(url):
+            # Acknowledged then ended by the proxy, without a tick
+            connected.append(time.monotonic())
+            return b'ok'
+
+        at_hub = ActiveTick()
+        at_hub.r = fake_session(connect)
+        hub = StreamHub(at_hub, retries=3, reconnect_delay=0.05)
+        subscription = hub.subscribe('SPY')
+        assert list(subscription) == [] and isinstance(subscription.error, ConnectionError)
+        assert len(connected) == 4 and hub.error is subscription.error
+        delays = [b - a for a, b in zip(connected, connected[1:])]
+        assert delays[0] >= 0.05 and delays[2] >= 0.2
+
+class TestQuoteTable():
+    def test_ticks_update_slots_in_place(self):
+        table = QuoteTable(capacity=1)
+        table.update(parse_tick(b'Q,SPY,0,P,Q,216.46,216.55,100,200,20160928093000091'))
+        table.update(parse_tick(b'T,VXX,1,0,0,0,0,Q,35.10,300,20160928093000092'))
+        snapshot = table.snapshot()
+
+        quotes, trades = parse_stream_batch([b'Q,SPY,0,P,Q,216.47,216.56,100,200,20160928093000093',
+                                             b'Q,SPY,0,P,Q,216.48,216.57,100,200,20160928093000094'])
+        table.update_frame((quotes, trades))
+
+        assert len(table) == 2 and list(snapshot.index) == ['SPY', 'VXX']
+        assert snapshot.loc['SPY', 'bid'] == np.float32(216.48)
+        assert snapshot.loc['VXX', 'lastz'] == 300 and np.isnan(snapshot.loc['VXX', 'bid'])
+        assert snapshot.loc['SPY', 'quote_datetime'] == pd.Timestamp('2016-09-28 09:30:00.094')
+
+
+class TestMemoryCache():
+    def test_lru_eviction_by_size(self):
+        frame = pd.DataFrame({'close': np.zeros(100, dtype=np.float64)})
+        cache = MemoryCache(max_bytes=int(frame.memory_usage(index=True, deep=True).sum()) * 2)
+        cache.set('a', frame)
+        cache.set('b', frame)
+        assert cache.get('a') is frame
+        cache.set('c', frame)
+        assert 'b' not in cache and 'a' in cache and 'c' in cache
+
+    def test_repeat_hits_skip_the_proxy(self):
+        requests = []
+
+        class FakeProxy(ActiveTick):
+            def _barDataRequest(self, symbol, historyType, intradayMinutesAttr, beginTime_s, endTime_s):
+                requests.append(beginTime_s)
+                index = pd.date_range(datetime.strptime(beginTime_s, BAR_DATE_FMT),
+                                      datetime.strptime(endTime_s, BAR_DATE_FMT), freq='h', name='datetime')
+                return pd.DataFrame({'close': np.arange(len(index), dtype=np.float32)}, index=index)
+
+        at = FakeProxy(memory_cache=MemoryCache())
+        begin, end = datetime(2016, 9, 27, 9), datetime(2016, 9, 28, 16)
+        first = at.barData('INTC', beginTime=begin, endTime=end)
+        second = at.barData('INTC', beginTime=begin, endTime=end)
+        assert len(requests) == 1 and len(first) == 32
+        assert first.equals(second)
+
+        # Daily bars are cached under one key whatever intradayMinutes is
+        daily = at.barData('INTC', 'D', 0, begin, end)
+        assert at.barData('INTC', 'D', beginTime=begin, endTime=end).equals(daily) and len(requests) == 2
+
+    def test_evicted_segments_are_fetched_again(self):
+        requests = []
+        index = pd.date_range(datetime(2016, 9, 27, 9, 30), datetime(2016, 9, 29, 16), freq='min', name='datetime')
+        ticks = pd.DataFrame({'bid': np.arange(len(index), dtype=np.float32)}, index=index)
+        ticks = ticks[ticks.index.day != 28]
+
+        FakeProxy = fake_tick_proxy(ticks, requests)
+        at = FakeProxy(memory_cache=MemoryCache())
+        begin, end = datetime(2016, 9, 27), datetime(2016, 9, 29, 23)
+        first = at.tickData('SPY', beginTime=begin, endTime=end)
+        assert at.memory_cache.get('AT:TICKDATA:SPY:0:1:20160928').empty
+
+        # The day without ticks is stored as empty, only the evicted day is requested again
+        at.memory_cache.delete('AT:TICKDATA:SPY:0:1:20160929')
+        second = at.tickData('SPY', beginTime=begin, endTime=end)
+        assert len(first) == len(ticks) and second.equals(first)
+        assert requests[1:] == [('20160929000000', '20160929230001')]
+
+    def test_proxy_errors_are_not_cached_and_cache_errors_are_raised(self):
+        index = pd.date_range(datetime(2016, 9, 27, 9, 30), periods=10, freq='min', name='datetime')
+        ticks = pd.DataFrame({'bid': np.arange(len(index), dtype=np.float32)}, index=index)
+        failures = [ValueError('malformed')]
+
+        class FakeProxy(fake_tick_proxy(ticks)):
+            def _tickDataRequest(self, *args):
+                if failures:
+                    raise failures.pop()
+                return super()._tickDataRequest(*args)
+
+        at = FakeProxy(memory_cache=MemoryCache())
+        begin, end = datetime(2016, 9, 27), datetime(2016, 9, 27, 23)
+        assert at.tickData('SPY', beginTime=begin, endTime=end).empty
+        assert len(at.tickData('SPY', beginTime=begin, endTime=end)) == len(ticks)
+
+        class BrokenCache(MemoryCache):
+            def get(self, key):
+                raise ConnectionError('cache down')
+
+        try:
+            FakeProxy(memory_cache=BrokenCache()).tickData('SPY', beginTime=begin, endTime=end)
+            assert False, 'cache errors must not be caught'
+        except ConnectionError:
+            pass
+
+
+class TestSerializers():
+    def test_round_trip_and_versioning(self):
+        df = parse_tick_data(b'Q,20160928093000091,216.46,216.55,100,200,P,Q,0\r\n'
+                             b'T,20160928093000092,216.50,300,Q,0,0,0,0\r\n', trades=True, quotes=True)
+        for serializer in (ArrowSerializer(), ArrowSerializer(compression='zstd'), PickleSerializer()):
+            restored = serializer.loads(serializer.dumps(df))
+            assert restored.equals(df) and list(restored.dtypes) == list(df.dtypes)
+
+        # Pickles are only read by clients configured for them
+        pickled = PickleSerializer().dumps(df)
+        for read in (loads, ArrowSerializer().loads):
+            try:
+                read(pickled)
+                assert False, 'pickles must not be read without PickleSerializer'
+            except ValueError:
+                pass
+
+        blob = bytearray(ArrowSerializer().dumps(df))
+        blob[4] = ArrowSerializer.version + 1
+        try:
+            loads(bytes(blob))
+            assert False, 'newer format versions must not be read'
+        except ValueError:
+            pass
+
+
+class TestLocalStore():
+    def test_multi_day_queries_read_partitions(self, tmp_path):
+        requests = []
+        index = pd.date_range(datetime(2016, 9, 27, 9, 30), datetime(2016, 9, 29, 16), freq='min', name='datetime')
+        ticks = pd.DataFrame({'bid': np.arange(len(index), dtype=np.float32)}, index=index)
+
+        FakeProxy = fake_tick_proxy(ticks, requests)
+        at = FakeProxy(cache=LocalStore(str(tmp_path)))
+        first = at.tickData('SPY', beginTime=datetime(2016, 9, 27, 12), endTime=datetime(2016, 9, 29, 12))
+        second = at.tickData('SPY', beginTime=datetime(2016, 9, 28, 10), endTime=datetime(2016, 9, 29, 10))
+        assert len(requests) == 1
+        assert (tmp_path / 'TICKDATA' / 'SPY' / '0' / '1' / '20160928.arrow').exists()
+        assert second.equals(first[(first.index >= datetime(2016, 9, 28, 10)) &
+                                   (first.index <= datetime(2016, 9, 29, 10))])
+
+
+class TestBarBuilder():
+    def test_trades_build_bars_like_barData(self):
+        builder = BarBuilder(minutes=(1, 5))
+        for line in [b'T,SPY,1,0,0,0,0,Q,216.50,300,20160928093000092',
+                     b'Q,SPY,0,P,Q,216.46,216.55,100,200,20160928093000093',
+                     b'T,SPY,1,0,0,0,0,Q,216.70,100,20160928093059092',
+                     b'T,SPY,1,0,0,0,0,Q,216.40,100,20160928093100000']:
+            builder.update(parse_tick(line))
+
+        bars = builder.pop_bars(1)
+        assert list(bars.index) == [('SPY', pd.Timestamp('2016-09-28 09:30'))]
+        assert dict(bars.dtypes) == {name: np.dtype(dtype) for name, dtype in BAR_DTYPES.items() if name != 'datetime'}
+        assert bars.iloc[0].tolist() == [np.float32(216.5), np.float32(216.7), np.float32(216.5), np.float32(216.7), 400]
+
+        builder.flush(datetime(2016, 9, 28, 9, 32))
+        assert builder.pop_bars(1)['volume'].tolist() == [100] and builder.pop_bars(5).empty
+        assert builder.open_bars(5)['volume'].tolist() == [500]
+
+
+class TestDerivedBars():
+    # 1 minute bars and the 5 minute bars for the same session, in the proxy's barData format
+    MINUTE_BARS = (b'20160928093000,37.52,37.55,37.50,37.54,120000\r\n'
+                   b'20160928093100,37.54,37.60,37.53,37.58,80000\r\n'
+                   b'20160928093200,37.58,37.58,37.40,37.41,95000\r\n'
+                   b'20160928093300,37.41,37.45,37.38,37.44,60000\r\n'
+                   b'20160928093400,37.44,37.47,37.42,37.46,40000\r\n'
+                   b'20160928093500,37.46,37.50,37.45,37.49,30000\r\n'
+                   b'20160928093600,37.49,37.49,37.30,37.31,70000\r\n'
+                   b'20160928093800,37.31,37.36,37.29,37.35,20000\r\n'
+                   b'20160928093900,37.35,37.39,37.34,37.38,25000\r\n'
+                   b'20160928094000,37.38,37.42,37.37,37.40,15000\r\n'
+                   b'20160928094100,37.40,37.41,37.33,37.34,35000\r\n')
+    FIVE_MINUTE_BARS = (b'20160928093000,37.52,37.60,37.38,37.46,395000\r\n'
+                        b'20160928093500,37.46,37.50,37.29,37.38,145000\r\n'
+                        b'20160928094000,37.38,37.42,37.33,37.34,50000\r\n')
+
+    def test_derived_bars_match_proxy_bars(self):
+        requests = []
+        minute_bars = parse_bar_data(self.MINUTE_BARS)
+
+        class FakeProxy(ActiveTick):
+            def _barDataRequest(self, symbol, historyType, intradayMinutesAttr, beginTime_s, endTime_s):
+                requests.append(intradayMinutesAttr)
+                return minute_bars
+
+        at = FakeProxy(memory_cache=MemoryCache())
+        begin, end = datetime(2016, 9, 28, 9, 30), datetime(2016, 9, 28, 9, 42)
+        five = at.barData('INTC', intradayMinutes=5, beginTime=begin, endTime=end, derive=True)
+        fifteen = at.barData('INTC', intradayMinutes=15, beginTime=begin, endTime=end, derive=True)
+        assert requests == ['intradayMinutes=1&']
+        assert five.equals(parse_bar_data(self.FIVE_MINUTE_BARS))
+        assert fifteen['volume'].tolist() == [590000] and fifteen.index[0] == datetime(2016, 9, 28, 9, 30)
+
+        # Sizes not dividing a day start again from each midnight, like BarBuilder
+        seven = at.barData('INTC', intradayMinutes=7, beginTime=begin, endTime=end, derive=True)
+        assert list(seven.index) == [_bar_start(t, 7) for t in (begin, begin + timedelta(minutes=4), end)]
+        assert seven['volume'].tolist() == [355000, 200000, 35000]
+        assert resample_bars(minute_bars, 1440)['volume'].tolist() == [minute_bars['volume'].sum()]
+
+
+class TestStreamRecorder():
+    def test_replay_reproduces_the_stream(self, tmp_path):
+        lines = [b'Q,SPY,0,P,Q,216.46,216.55,100,200,20160928093000091',
+                 b'T,SPY,1,0,0,17,0,Q,216.5,300,20160928093000092',
+                 b'Q,OPTION:SPY---161014P00186000,0,P,Q,1.05,1.1,10,20,20160928093000500',
+                 b'T,VXX,1,0,0,0,0,Q,35.1,100,20160929093500000',
+                 b'Q,VXX,200,P,Q,35.05,35.1,100,200,20160929093500001',
+                 b'T,VXX,1,-3,0,0,0,Q,35.1,100,20160929093500002']
+        with StreamRecorder(str(tmp_path), buffer_size=2) as recorder:
+            for line in lines:
+                recorder.record(parse_tick(line))
+
+        assert sorted(path.name for path in tmp_path.glob('*.ticks')) == ['20160928.ticks', '20160929.ticks']
+        assert list(StreamReplay(str(tmp_path)).lines()) == lines
+        assert list(StreamReplay(str(tmp_path), symbols='SPY', begin=datetime(2016, 9, 28, 9, 30)).ticks()) == \
+            [parse_tick(line) for line in lines[:2]]
+
+        # Frames are recorded with their numpy condition codes, quote conds above 127 included
+        with StreamRecorder(str(tmp_path / 'frames')) as recorder:
+            recorder.record_frame(parse_stream_batch(lines))
+        assert sorted(StreamReplay(str(tmp_path / 'frames')).lines()) == sorted(lines)
+
+
+class TestMetrics():
+    def test_requests_parsing_and_cache_are_recorded(self):
+        begin = datetime(2016, 9, 28, 9, 30)
+        body = ''.join('Q,{t}000,216.46,216.55,100,200,P,Q,0\r\n'.format(t=(begin + timedelta(seconds=i)).strftime(
+            '%Y%m%d%H%M%S')) for i in range(60)).encode()
+
+        metrics = Metrics()
+        at_metrics = ActiveTick(memory_cache=MemoryCache(), metrics=metrics)
+        at_metrics.r = fake_session(lambda url: body)
+        for i in range(2):
+            df = at_metrics.tickData('SPY', beginTime=begin, endTime=begin + timedelta(minutes=1))
+
+        assert len(df) == 60
+        assert metrics.get('request_seconds', 'tickData', 'SPY')[0] == 1
+        assert metrics.get('bytes', 'tickData') == (1, len(body))
+        assert metrics.get('rows', 'tickData', 'SPY') == (1, 60)
+        assert metrics.get('cache_misses', 'tickData', 'SPY')[0] == 1
+        assert metrics.get('cache_hits', 'tickData', 'SPY')[0] == 1
+        assert 'parse_seconds' in metrics.summary().index.get_level_values('metric')
+
+    def test_stream_lag_is_sampled(self):
+        lines = [b'Q,SPY,0,P,Q,216.46,216.55,100,200,20160928093000091'] * 250
+        metrics = Metrics(clock=lambda: datetime(2016, 9, 28, 9, 30, 1))
+
+        assert list(measure_stream(iter(lines), metrics, sample=100)) == lines
+        assert metrics.get('stream_ticks', 'quoteStream') == (3, 250)
+        count, total = metrics.get('stream_lag_seconds', 'quoteStream', 'SPY')
+        assert count == 2 and abs(total - 2 * 0.909) < 1e-9
+
+        # Lag is measured in exchange time by default, whatever the host's timezone
+        assert Metrics().clock is exchange_now
+
+
+class TestOptionChain():
+    def test_chain_is_decoded_cached_and_quoted(self):
+        chain = ''.join('OPTION:SPY---1610{day:02d}{right}{strike:08d}\r\n'.format(
+            day=14 + i % 2, right='CP'[i // 2 % 2], strike=186000 + i // 4 * 500) for i in range(40)).encode()
+        requested = []
+
+        def answer(url):
+            requested.append(url)
+            if '/optionChain' in url:
+                return chain
+            symbols = re.search(r'symbol=([^&]+)', url).group(1).split('+')
+            return ''.join('{symbol},1,22,1,7,1.5\r\n'.format(symbol=symbol) for symbol in symbols).encode()
+
+        at_chain = ActiveTick()
+        at_chain.r = fake_session(answer)
+        df = at_chain.optionChain('SPY')
+        assert len(df) == 40 and (df['underlying'] == 'SPY').all()
+        assert df['expiry'].iloc[1] == datetime(2016, 10, 15) and df['right'].iloc[2] == 'P'
+        assert df['strike'].max() == 190.5
+
+        # Changes to a returned chain don't reach the cached one
+        df['mid'] = 1.0
+        df.loc[df.index[0], 'strike'] = 0.0
+        again = at_chain.optionChain('SPY')
+        assert 'mid' not in again.columns and again['strike'].min() == 186.0
+
+        snapshot = at_chain.optionChainSnapshot('SPY', 'BidPrice', expiry=datetime(2016, 10, 14), strikes=(187, 189),
+                                                right='C', max_url_length=120)
+        assert len(requested) > 2 and sum('/optionChain' in url for url in requested) == 1
+        assert len(snapshot) == 5 and (snapshot['BidPrice'] == 1.5).all()
+        assert (snapshot['expiry'] == datetime(2016, 10, 14)).all() and snapshot['strike'].between(187, 189).all()
+
+
+class TestConcurrentCallers():
+    def test_identical_requests_are_coalesced(self):
+        body = b'20160928093000,37.52,37.52,37.25,37.395,1792940\r\n'
+        requested = []
+        release = threading.Event()
+
+        def answer(url):
+            requested.append(url)
+            release.wait(5)
+            return body
+
+        at_shared = ActiveTick()
+        at_shared.r = fake_session(answer)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(at_shared.barData, 'INTC', 'I', 1, datetime(2016, 9, 28, 9, 30),
+                                   datetime(2016, 9, 28, 9, 31)) for i in range(4)]
+            while not requested:
+                time.sleep(0.01)
+            time.sleep(0.1)
+            release.set()
+            frames = [future.result() for future in futures]
+
+        assert len(requested) == 1
+        assert all(df.equals(frames[0]) for df in frames) and len(frames[0]) == 1
+
+        # Each caller gets its own frame
+        assert len(set(id(df) for df in frames)) == len(frames)
+        frames[0]['mid'] = 1.0
+        assert all('mid' not in df.columns for df in frames[1:])
+
+    def test_ranges_of_one_symbol_are_fetched_concurrently(self):
+        both_requested = threading.Barrier(2, timeout=5)
+
+        def answer(url):
+            # Each request waits for the other one, they fail unless both are in flight at once
+            both_requested.wait()
+            day = re.search(r'beginTime=(\d{8})', url).group(1)
+            return '{day}093000,37.52,37.52,37.25,37.395,1792940\r\n'.format(day=day).encode()
+
+        at_shared = ActiveTick(memory_cache=MemoryCache())
+        at_shared.r = fake_session(answer)
+        days = [datetime(2016, 9, 27), datetime(2016, 9, 28)]
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            frames = list(pool.map(lambda day: at_shared.barData('INTC', 'I', 1, day, day + timedelta(hours=16)),
+                                   days))
+        assert [len(df) for df in frames] == [1, 1]
+        assert len(at_shared.barData('INTC', 'I', 1, days[0], days[1] + timedelta(hours=16))) == 2
+
+    def test_sessions_are_per_thread(self):
+        at_shared = ActiveTick()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            sessions = list(pool.map(lambda i: (threading.get_ident(), at_shared.r), range(50)))
+        by_thread = {ident: session for ident, session in sessions}
+        assert all(by_thread[ident] is session for ident, session in sessions)
+        assert len({id(session) for session in by_thread.values()}) == len(by_thread)
+        assert all(session.get_adapter('http://127.0.0.1') is at_shared._adapter for session in by_thread.values())
+
+
+class TestRecords():
+    def test_records_round_trip_with_fixed_point_prices(self):
+        content = b'Q,20160928093000091,216.46,216.55,100,200,P,Q,0\r\nT,20160928093000092,216.5,300,Q,0,17,0,0\r\n'
+        df = parse_tick_data(content, trades=True, quotes=True)
+        records = to_records(df, decimals=2)
+
+        assert records.dtype.names[:3] == ('datetime', 'type', 'last')
+        assert records['bid'].tolist() == [21646, MISSING_PRICE] and records['type'].tolist() == [b'Q', b'T']
+        back = to_frame(records, index='datetime', decimals=2)
+        assert np.allclose(back['bid'].values, df['bid'].values, equal_nan=True)
+        assert (back['bidz'].values[:1] == df['bidz'].values[:1]).all()
+
+    def test_stream_records_and_bar_columns(self):
+        quote = stream_record(b'Q,SPY,0,P,Q,216.46,216.55,100,200,20160928093000091', decimals=4)
+        assert quote['symbol'] == b'SPY' and quote['bid'] == 2164600 and quote['askz'] == 200
+        assert quote['datetime'] == np.datetime64('2016-09-28T09:30:00.091')
+
+        at_columns = ActiveTick()
+        at_columns.r = fake_session(lambda url: b'20160928093000,37.52,37.52,37.25,37.395,1792940\r\n')
+        columns = at_columns.barData('INTC', 'I', 1, datetime(2016, 9, 28, 9, 30), datetime(2016, 9, 28, 9, 31),
+                                     output='columns')
+        assert list(columns) == ['datetime'] + BAR_NAMES[1:]
+        assert columns['close'].dtype == BAR_DTYPES['close'] and columns['volume'].tolist() == [1792940]
+
+
+class TestBackfill():
+    def test_interrupted_backfill_resumes(self, tmp_path):
+        requested = []
+        interrupted = []
+
+        def answer(url):
+            requested.append(url)
+            if 'symbol=VXX' in url and len(interrupted) < 3:
+                interrupted.append(url)
+                raise IOError('connection reset')
+            day = re.search(r'beginTime=(\d{8})', url).group(1)
+            return '{day}093000,37.52,37.52,37.25,37.395,1792940\r\n'.format(day=day).encode()
+
+        jobs = schedule_jobs(['INTC', 'VXX'], datetime(2016, 9, 23), datetime(2016, 9, 27), bars=[1])
+        assert [job[2].day for job in jobs[:3]] == [23, 26, 27] and len(jobs) == 6
+
+        # Days the cache would not keep yet are not scheduled, daily bars only up to the current year
+        unsettled = schedule_jobs(['INTC'], datetime(2015, 12, 31), datetime(2016, 1, 5), bars=[1, 'D'],
+                                  ticks='both', now=datetime(2016, 1, 4, 16))
+        assert [(job[1], job[2].day, job[3].day) for job in unsettled] == \
+            [('bars:1', 31, 1), ('bars:1', 1, 2), ('bars:D', 31, 1), ('ticks:both', 31, 1), ('ticks:both', 1, 2)]
+
+        checkpoint = Checkpoint(str(tmp_path / 'backfill.checkpoint'))
+        with ThreadPoolExecutor(max_workers=2) as parse_executor:
+            at_backfill = ActiveTick(cache=LocalStore(str(tmp_path)), parse_executor=parse_executor)
+            at_backfill.r = fake_session(answer)
+            assert backfill(at_backfill, jobs, checkpoint, workers=1) == (3, 3)
+
+            # Only the failed jobs are fetched again
+            requested.clear()
+            assert backfill(at_backfill, jobs, Checkpoint(checkpoint.path), workers=1) == (3, 0)
+            assert len(requested) == 3 and all('symbol=VXX' in url for url in requested)
+            df = at_backfill.barData('VXX', 'I', 1, datetime(2016, 9, 26), datetime(2016, 9, 27, 16))
+            assert len(df) == 2 and len(requested) == 3